@@ -10,6 +10,26 @@ import os
 
 VERILOG_PATH = "CV_acceleration/src/OV5640/ov5640_cfg.v"
 
+# 0x4300 bits [7:4] -> output format, bytes per pixel
+FORMAT_CONTROL = {
+    0x0: ("RAW8", 1),
+    0x1: ("Y8", 1),
+    0x3: ("YUV422", 2),
+    0x6: ("RGB565", 2),
+}
+# 0x4300 bits [3:0] -> component order, for the formats where it matters
+YUV422_ORDER = {0x0: "YUYV", 0x1: "YVYU", 0x2: "UYVY", 0x3: "VYUY"}
+BAYER_ORDER = {0x0: "BGGR", 0x1: "GBRG", 0x2: "GRBG", 0x3: "RGGB"}
+# 0x501F bits [2:0] -> format MUX
+FORMAT_MUX = {
+    0x0: "ISP YUV422",
+    0x1: "ISP RGB",
+    0x2: "ISP dither",
+    0x3: "ISP RAW (DPC)",
+    0x4: "SNR RAW",
+    0x5: "ISP RAW (CIP)",
+}
+
 
 class OV5640Calculator:
     """Calculator for OV5640 camera configuration based on Verilog files"""
@@ -55,6 +75,9 @@ class OV5640Calculator:
             # Binning/Sampling
             0x3814: "X Sample Increment",
             0x3815: "Y Sample Increment",
+            # Output format
+            0x4300: "Format Control",
+            0x501F: "Format MUX Control",
         }
 
     def read_verilog_file(self, file_path):
@@ -73,7 +96,7 @@ class OV5640Calculator:
             print(f"Error: File '{file_path}' not found.")
             return None
 
-    def extract_registers_from_verilog(self, verilog_content):
+    def extract_registers_from_verilog(self, verilog_content, verbose=True):
         """Extract register configurations using regex"""
         registers = {}
 
@@ -93,7 +116,8 @@ class OV5640Calculator:
 
             registers[reg_addr] = reg_value
 
-        print(f"Extracted {len(registers)} register configurations")
+        if verbose:
+            print(f"Extracted {len(registers)} register configurations")
         return registers
 
     def get_16bit_register(self, registers, high_addr, low_addr):
@@ -259,6 +283,36 @@ class OV5640Calculator:
             "y_inc_raw": y_inc,
         }
 
+    def calculate_output_format(self, registers):
+        """Decode the DVP output pixel format from 0x4300 and 0x501F"""
+
+        format_reg = registers.get(0x4300, 0x30)
+        mux_reg = registers.get(0x501F, 0x00)
+
+        pixel_format, bytes_per_pixel = FORMAT_CONTROL.get(
+            format_reg >> 4, (f"UNKNOWN(0x{format_reg:02X})", 2)
+        )
+        # The MUX decides what 0x4300 formats: RAW output bypasses the ISP
+        mux = FORMAT_MUX.get(mux_reg & 0x07, f"UNKNOWN({mux_reg & 0x07})")
+        if "RAW" in mux:
+            pixel_format, bytes_per_pixel = "RAW8", 1
+
+        if pixel_format == "YUV422":
+            order = YUV422_ORDER.get(format_reg & 0x0F, "YUYV")
+        elif pixel_format == "RAW8":
+            order = BAYER_ORDER.get(format_reg & 0x03, "BGGR")
+        else:
+            order = None
+
+        return {
+            "format_control_reg": format_reg,
+            "format_mux_reg": mux_reg,
+            "format_mux": mux,
+            "pixel_format": pixel_format,
+            "component_order": order,
+            "bytes_per_pixel": bytes_per_pixel,
+        }
+
     def calculate_frame_timing(self, registers, pixel_clk_mhz):
         """Calculate frame timing and rates"""
 
@@ -378,6 +432,24 @@ class OV5640Calculator:
         print(f"  Width Match:        {'✅' if resolution['width_matches'] else '❌'}")
         print(f"  Height Match:       {'✅' if resolution['height_matches'] else '❌'}")
 
+        # Output format
+        output = self.calculate_output_format(registers)
+        frame_bytes = (
+            resolution["output_width"]
+            * resolution["output_height"]
+            * output["bytes_per_pixel"]
+        )
+        print(f"\n🎨 OUTPUT FORMAT:")
+        print(f"  0x4300 (Format):    0x{output['format_control_reg']:02X}")
+        print(
+            f"  0x501F (MUX):       0x{output['format_mux_reg']:02X} ({output['format_mux']})"
+        )
+        print(f"  Pixel Format:       {output['pixel_format']}")
+        if output["component_order"]:
+            print(f"  Component Order:    {output['component_order']}")
+        print(f"  Bytes per Pixel:    {output['bytes_per_pixel']}")
+        print(f"  Frame Size:         {frame_bytes:,} bytes")
+
         # Timing analysis
         timing = self.calculate_frame_timing(registers, clocks["pixel_clk_mhz"])
         print(f"\n⏱️  FRAME TIMING:")
@@ -408,6 +480,8 @@ class OV5640Calculator:
             0x380B,
             0x3814,
             0x3815,
+            0x4300,
+            0x501F,
         ]
 
         for addr in key_regs:
@@ -436,12 +510,14 @@ class OV5640Calculator:
         clocks = self.calculate_pll_clocks(registers, input_clock_mhz)
         resolution = self.calculate_resolution_and_binning(registers)
         timing = self.calculate_frame_timing(registers, clocks["pixel_clk_mhz"])
+        output = self.calculate_output_format(registers)
 
         return {
             "registers": registers,
             "clocks": clocks,
             "resolution": resolution,
             "timing": timing,
+            "format": output,
         }
 
 
@@ -0,0 +1,375 @@
+"""
+Throughput benchmarks for the host-side streaming pipeline, run on synthetic
+streams in the exact FPGA format (top.v): RGB565 frames, each followed by 256
+words of 0xA0A0, with optional dropouts, truncated frames and false markers.
+
+Compare against the recorded baselines, exits non-zero on a regression:
+    python CV_acceleration/src/usb_2_0/benchmark.py
+Record new baselines on the capture station itself:
+    python CV_acceleration/src/usb_2_0/benchmark.py --record
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import threading
+import time
+import multiprocessing as mp
+
+import numpy as np
+
+import packets_analyzer
+import smooth_stream
+from frame_decode import decode_rgb565_bgr, decode_raw8_bgr, decode_yuv422_bgr
+from frame_source import MARKER_BYTES
+from marker_scanner import MarkerScanner, MARKER_VALUE
+from pipeline_stats import PipelineStats
+from shared_buffers import ByteRing, FramePool
+
+RESOLUTIONS = ((640, 480), (1280, 720), (1920, 1080))
+BENCH_FRAMES = 24  # Frames per synthetic stream
+REPEATS = 5  # Best of this many runs is reported
+MIN_RUN_SECONDS = 0.2  # Short stages are looped for at least this long per run
+CHUNK_SIZE = 1024 * 1024  # Bytes per scanner feed / ring write, like a transfer
+FAULT_RATE = 0.1  # Per-frame probability of each injected fault
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), "benchmark_baselines.json")
+REGRESSION_TOLERANCE = 0.25  # Fail below this fraction under the baseline
+
+
+def synth_stream(
+    width, height, n_frames, dropouts=0.0, truncated=0.0, false_markers=0.0, seed=0
+):
+    """
+    Build a synthetic FPGA byte stream.
+
+    Args:
+        width, height: Frame geometry, RGB565
+        n_frames: Frames in the stream
+        dropouts: Probability a frame loses a 4-64 KB span, as on a USB drop
+        truncated: Probability a frame is cut short before its marker
+        false_markers: Probability a frame holds a long 0xA0 run in its pixels
+        seed: RNG seed, streams are reproducible
+
+    Returns:
+        (stream, intact): uint8 array, number of frames without any fault
+    """
+    rng = np.random.default_rng(seed)
+    frame_size = width * height * 2
+    marker = np.full(MARKER_BYTES, MARKER_VALUE, dtype=np.uint8)
+    # Pixel data never holds 0xA0, so only the injected runs can look like markers
+    pixels = rng.integers(0, MARKER_VALUE, size=frame_size, dtype=np.uint8)
+
+    parts = [marker]
+    intact = 0
+    for i in range(n_frames):
+        frame = np.roll(pixels, i * 4099)
+        faulty = False
+        if rng.random() < false_markers:
+            at = int(rng.integers(0, frame_size - 1024))
+            frame[at : at + int(rng.integers(300, 1000))] = MARKER_VALUE
+            faulty = True
+        if rng.random() < dropouts:
+            at = int(rng.integers(0, frame_size - 65536))
+            lost = int(rng.integers(4096, 65536))
+            frame = np.concatenate((frame[:at], frame[at + lost :]))
+            faulty = True
+        if rng.random() < truncated:
+            frame = frame[: int(frame_size * rng.uniform(0.1, 0.9))]
+            faulty = True
+        intact += not faulty
+        parts.append(frame)
+        parts.append(marker)
+    return np.concatenate(parts), intact
+
+
+def _best(fn, repeats=REPEATS):
+    """Time fn() repeats times, return its result and the fastest time per call"""
+    best = None
+    for _ in range(repeats):
+        calls = 0
+        t0 = time.perf_counter()
+        while True:
+            result = fn()
+            calls += 1
+            dt = time.perf_counter() - t0
+            if dt >= MIN_RUN_SECONDS:
+                break
+        dt /= calls
+        if best is None or dt < best[1]:
+            best = (result, dt)
+    return best
+
+
+def bench_decode_fast(stream, width, height, n_frames):
+    if (width, height) != (smooth_stream.W, smooth_stream.H):
+        return None  # Geometry is fixed by the module config
+    frame = stream[MARKER_BYTES : MARKER_BYTES + width * height * 2]
+
+    def run():
+        for _ in range(n_frames):
+            smooth_stream.decode_rgb565_fast(frame)
+        return n_frames
+
+    frames, dt = _best(run)
+    return frames * frame.size, frames, dt
+
+
+def bench_decode_bgr(stream, width, height, n_frames):
+    frame = stream[MARKER_BYTES : MARKER_BYTES + width * height * 2]
+    out = np.empty((height, width, 3), dtype=np.uint8)
+
+    def run():
+        for _ in range(n_frames):
+            decode_rgb565_bgr(frame, out)
+        return n_frames
+
+    frames, dt = _best(run)
+    return frames * frame.size, frames, dt
+
+
+def bench_decode_yuv422(stream, width, height, n_frames):
+    frame = stream[MARKER_BYTES : MARKER_BYTES + width * height * 2]
+    out = np.empty((height, width, 3), dtype=np.uint8)
+
+    def run():
+        for _ in range(n_frames):
+            decode_yuv422_bgr(frame, out)
+        return n_frames
+
+    frames, dt = _best(run)
+    return frames * frame.size, frames, dt
+
+
+def bench_decode_raw8(stream, width, height, n_frames):
+    # Half the RGB565 frame bytes, one byte per pixel
+    frame = stream[MARKER_BYTES : MARKER_BYTES + width * height]
+    out = np.empty((height, width, 3), dtype=np.uint8)
+
+    def run():
+        for _ in range(n_frames):
+            decode_raw8_bgr(frame, out)
+        return n_frames
+
+    frames, dt = _best(run)
+    return frames * frame.size, frames, dt
+
+
+def bench_find_marker_fast(stream, width, height, n_frames):
+    # The original detector searched the unscanned span after every chunk
+    view = memoryview(stream)
+
+    def run():
+        found = 0
+        pos = 0
+        while pos < stream.size:
+            end = min(pos + CHUNK_SIZE, stream.size)
+            marker = smooth_stream.find_frame_marker_fast(view, pos, end)
+            if marker < 0:
+                pos = end
+            else:
+                pos += int(marker)
+                found += 1
+        return found
+
+    found, dt = _best(run)
+    return stream.size, found - 1, dt
+
+
+def bench_marker_scanner(stream, width, height, n_frames):
+    scanner = MarkerScanner(max_chunk=CHUNK_SIZE)
+
+    def run():
+        scanner.reset(0)
+        found = 0
+        for pos in range(0, stream.size, CHUNK_SIZE):
+            found += scanner.feed(stream[pos : pos + CHUNK_SIZE]).size
+        return found
+
+    found, dt = _best(run)
+    return stream.size, found - 1, dt
+
+
+def bench_post_process(stream, width, height, n_frames):
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            packets_analyzer.post_process(stream, save=False, report_path=None)
+        return n_frames
+
+    frames, dt = _best(run)
+    return stream.size, frames, dt
+
+
+def bench_detector_process(stream, width, height, n_frames):
+    """Full marker_detector_process in its own process, fed through the ring"""
+    if (width, height) != (smooth_stream.W, smooth_stream.H):
+        return None  # Geometry is fixed by the module config
+    if smooth_stream.STREAM_FORMAT.bytes_per_pixel != 2:
+        return None  # The synthetic stream is 2 bytes per pixel
+
+    ring = ByteRing.create(smooth_stream.RING_SIZE, smooth_stream.RING_MIRROR)
+    pool = FramePool.create(smooth_stream.FRAME_SLOTS, smooth_stream.FRAME_SIZE)
+    stats = PipelineStats.create()
+    frame_queue = mp.Queue(maxsize=smooth_stream.FRAME_SLOTS)
+    stop = mp.Event()
+    detector = mp.Process(
+        target=smooth_stream.marker_detector_process,
+        args=(ring.name, pool.name, stats.name, frame_queue, stop),
+    )
+    detector.start()
+
+    received = []  # perf_counter() of every frame handed out
+
+    def consume():
+        while not stop.is_set():
+            try:
+                slot = frame_queue.get(timeout=0.1)
+            except Exception:
+                continue
+            pool.release(slot)
+            received.append(time.perf_counter())
+
+    consumer = threading.Thread(target=consume, daemon=True)
+    consumer.start()
+
+    def feed(data):
+        for pos in range(0, data.size, CHUNK_SIZE):
+            chunk = data[pos : pos + CHUNK_SIZE]
+            while ring.capacity - ring.fill() < chunk.size:
+                time.sleep(0.0005)
+            ring.write(chunk, time.perf_counter())
+
+    try:
+        # Warm up until the detector process is running and emitting
+        frame_bytes = width * height * 2 + MARKER_BYTES
+        warmup = 3 * frame_bytes + MARKER_BYTES
+        feed(stream[:warmup])
+        deadline = time.perf_counter() + 30
+        while not received and time.perf_counter() < deadline:
+            time.sleep(0.01)
+        warm = len(received)
+
+        t0 = time.perf_counter()
+        feed(stream[warmup:])
+        # Done once the ring is drained and no frame arrived for a while
+        while time.perf_counter() < deadline:
+            time.sleep(0.1)
+            last = received[-1] if received else t0
+            if ring.fill() < frame_bytes and time.perf_counter() - last > 0.3:
+                break
+        t1 = received[-1] if len(received) > warm else time.perf_counter()
+        return stream.size - warmup, len(received) - warm, t1 - t0
+    finally:
+        stop.set()
+        consumer.join()
+        detector.join(3)
+        if detector.is_alive():
+            detector.terminate()
+        ring.close()
+        pool.close()
+        stats.close()
+
+
+STAGES = (
+    ("decode_rgb565_fast", bench_decode_fast),
+    ("decode_rgb565_bgr", bench_decode_bgr),
+    ("decode_yuv422_bgr", bench_decode_yuv422),
+    ("decode_raw8_bgr", bench_decode_raw8),
+    ("find_frame_marker_fast", bench_find_marker_fast),
+    ("marker_scanner", bench_marker_scanner),
+    ("marker_detector_process", bench_detector_process),
+    ("post_process", bench_post_process),
+)
+
+
+def run_benchmarks(resolutions=RESOLUTIONS, n_frames=BENCH_FRAMES, faults=FAULT_RATE):
+    """Return {"stage@WxH": {"mb_s", "fps"}} for every stage and resolution"""
+    results = {}
+    for width, height in resolutions:
+        stream, intact = synth_stream(
+            width,
+            height,
+            n_frames,
+            dropouts=faults,
+            truncated=faults,
+            false_markers=faults,
+        )
+        print(
+            f"\n{width}x{height}: {stream.size / 1024 / 1024:.1f} MB stream, "
+            f"{n_frames} frames, {intact} intact"
+        )
+        for name, fn in STAGES:
+            measured = fn(stream, width, height, n_frames)
+            if measured is None:
+                continue
+            nbytes, frames, dt = measured
+            key = f"{name}@{width}x{height}"
+            results[key] = {
+                "mb_s": nbytes / dt / 1024 / 1024,
+                "fps": frames / dt,
+            }
+            print(
+                f"  {name:<26}{results[key]['mb_s']:10.1f} MB/s "
+                f"{results[key]['fps']:10.1f} frames/s"
+            )
+    return results
+
+
+def compare(results, baselines, tolerance=REGRESSION_TOLERANCE):
+    """Return the stages slower than their baseline by more than tolerance"""
+    regressions = []
+    for key, base in sorted(baselines.items()):
+        if key not in results:
+            continue
+        floor = base["mb_s"] * (1 - tolerance)
+        if results[key]["mb_s"] < floor:
+            regressions.append((key, results[key]["mb_s"], base["mb_s"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--record", action="store_true", help="Save new baselines")
+    parser.add_argument("--baselines", default=BASELINE_FILE)
+    parser.add_argument("--frames", type=int, default=BENCH_FRAMES)
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE)
+    parser.add_argument(
+        "--quick",
+        action="store_true",
+        help=f"Only {RESOLUTIONS[0][0]}x{RESOLUTIONS[0][1]}",
+    )
+    args = parser.parse_args()
+
+    mp.set_start_method("spawn", force=True)
+    results = run_benchmarks(
+        RESOLUTIONS[:1] if args.quick else RESOLUTIONS, args.frames
+    )
+
+    if args.record:
+        with open(args.baselines, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"\nBaselines written to '{args.baselines}'")
+        return 0
+
+    if not os.path.exists(args.baselines):
+        print(f"\nNo baselines at '{args.baselines}', run with --record first")
+        return 1
+    with open(args.baselines, encoding="utf-8") as f:
+        baselines = json.load(f)
+
+    regressions = compare(results, baselines, args.tolerance)
+    if regressions:
+        print(
+            f"\nREGRESSION: {len(regressions)} stage(s) more than {args.tolerance:.0%} slower"
+        )
+        for key, now, base in regressions:
+            print(f"  {key:<40}{now:10.1f} MB/s, baseline {base:10.1f} MB/s")
+        return 1
+    print("\nNo regressions against the baselines")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+"""
+Random-access reader for raw USB stream dumps and headless recordings.
+The file is memory-mapped, never loaded; frames come back as zero-copy views.
+
+A dump's frame boundaries are found once with the same 0xA0 marker rules as
+the live detector and cached in a sidecar file (<dump>.fidx.npz) that is
+rebuilt whenever the dump's size or mtime changes. Recordings already carry
+their own index (frame_recorder) and need no scan.
+"""
+
+import json
+import os
+import sys
+
+import numpy as np
+
+from frame_recorder import RECORDING_MAGIC, INDEX_DTYPE
+from frame_source import DUMP_PATH, MARKER_BYTES
+from marker_scanner import MarkerScanner, MARKER_MIN_SIZE
+from shared_buffers import FRAME_PADDED, FRAME_TRIMMED
+from stream_format import load_stream_format
+
+FRAME_SIZE = load_stream_format().frame_size
+FRAME_TOLERANCE = 0.02  # Accepted deviation of a frame's wire length
+SCAN_CHUNK = 16 * 1024 * 1024  # Bytes fed to the scanner at a time
+INDEX_SUFFIX = ".fidx.npz"
+INDEX_VERSION = 1
+
+
+class DumpReader:
+    """
+    Memory-mapped frame access to a stream dump or a recording.
+
+    Args:
+        path: Stream dump, or a recording's .frames file
+        frame_size: Pixel bytes per frame, ignored for recordings
+        min_size: Minimum 0xA0 run counted as a marker
+        rebuild: Rescan the dump even if a matching sidecar index exists
+    """
+
+    def __init__(
+        self, path, frame_size=FRAME_SIZE, min_size=MARKER_MIN_SIZE, rebuild=False
+    ):
+        self.path = path
+        self.frame_size = frame_size
+        self.min_size = min_size
+        self.metadata = {}
+        self.timestamps = None  # Wall-clock capture times, recordings only
+        self.rejected = 0  # Marker-delimited spans failing the length check
+
+        self.data = np.memmap(path, dtype=np.uint8, mode="r")
+        if self.data[: len(RECORDING_MAGIC)].tobytes() == RECORDING_MAGIC:
+            self._load_recording()
+        else:
+            self._load_dump(rebuild)
+
+    def _load_recording(self):
+        blob_len = int(np.frombuffer(self.data[12:16], dtype="<u4")[0])
+        self.metadata = json.loads(self.data[16 : 16 + blob_len].tobytes())
+        self.frame_size = self.metadata["frame_size"]
+
+        base = (
+            self.path[: -len(".frames")] if self.path.endswith(".frames") else self.path
+        )
+        index = np.fromfile(base + ".idx", dtype=INDEX_DTYPE)
+        # A recording cut short may index a frame that never reached the disk
+        index = index[index["offset"] + self.frame_size <= self.data.size]
+
+        self.offsets = index["offset"].astype(np.int64)
+        self.lengths = index["length"].astype(np.int64)
+        self.flags = index["flags"].astype(np.uint32)
+        self.frame_numbers = index["frame"].astype(np.int64)
+        self.timestamps = index["timestamp"]
+        # The recorder zero-pads short frames, every frame is frame_size on disk
+        self.sizes = np.full(self.offsets.size, self.frame_size, dtype=np.int64)
+
+    def _load_dump(self, rebuild):
+        st = os.stat(self.path)
+        sidecar = self.path + INDEX_SUFFIX
+        key = np.array(
+            [INDEX_VERSION, st.st_size, st.st_mtime_ns, self.frame_size, self.min_size],
+            dtype=np.int64,
+        )
+
+        index = None
+        if not rebuild and os.path.exists(sidecar):
+            try:
+                with np.load(sidecar) as z:
+                    if np.array_equal(z["key"], key):
+                        index = {name: z[name] for name in z.files}
+            except (OSError, ValueError, KeyError):
+                index = None  # Unreadable sidecar, rebuild it
+
+        if index is None:
+            index = self._scan()
+            index["key"] = key
+            tmp = sidecar + ".tmp"
+            with open(tmp, "wb") as f:
+                np.savez(f, **index)
+            os.replace(tmp, sidecar)
+
+        self.offsets = index["offsets"]
+        self.lengths = index["lengths"]
+        self.flags = index["flags"]
+        self.frame_numbers = np.arange(self.offsets.size, dtype=np.int64)
+        self.rejected = int(index["rejected"])
+        self.sizes = np.minimum(self.lengths, self.frame_size)
+
+    def _scan(self):
+        """Find every valid marker-delimited frame in the dump"""
+        scanner = MarkerScanner(self.min_size, SCAN_CHUNK)
+        scanner.reset(0)
+        found = []
+        for pos in range(0, self.data.size, SCAN_CHUNK):
+            found.append(scanner.feed(self.data[pos : pos + SCAN_CHUNK]))
+        markers = np.concatenate(found) if found else np.empty(0, dtype=np.int64)
+
+        # Same validation as the live detector, lengths include the marker
+        starts = markers[:-1]
+        lengths = np.diff(markers)
+        valid = (lengths >= int(self.frame_size * (1 - FRAME_TOLERANCE))) & (
+            lengths <= int(self.frame_size * (1 + FRAME_TOLERANCE))
+        )
+
+        offsets = starts[valid].astype(np.int64)
+        lengths = lengths[valid].astype(np.int64)
+        flags = np.zeros(offsets.size, dtype=np.uint32)
+        flags[lengths < self.frame_size] |= FRAME_PADDED
+        flags[lengths > self.frame_size + MARKER_BYTES] |= FRAME_TRIMMED
+        return {
+            "offsets": offsets,
+            "lengths": lengths,
+            "flags": flags,
+            "rejected": np.int64(np.count_nonzero(~valid)),
+        }
+
+    def __len__(self):
+        return self.offsets.size
+
+    def frame(self, n):
+        """
+        Zero-copy view of frame n's pixel bytes.
+
+        In a dump, frames flagged FRAME_PADDED are shorter than frame_size
+        since the view is not padded; FRAME_TRIMMED frames are cut to frame_size.
+        """
+        start = int(self.offsets[n])
+        return self.data[start : start + int(self.sizes[n])]
+
+    def __getitem__(self, n):
+        return self.frame(n)
+
+    def __iter__(self):
+        for n in range(len(self)):
+            yield self.frame(n)
+
+    def close(self):
+        # The mapping is released once the last view into it is gone
+        self.data = None
+
+
+def main(path=DUMP_PATH):
+    reader = DumpReader(path)
+    print(f"'{path}': {reader.data.size / 1024 / 1024:.1f} MB, {len(reader)} frames")
+    if len(reader):
+        print(f"Padded: {np.count_nonzero(reader.flags & FRAME_PADDED)}")
+        print(f"Trimmed: {np.count_nonzero(reader.flags & FRAME_TRIMMED)}")
+        print(f"Wire length: {reader.lengths.min()}..{reader.lengths.max()} bytes")
+    print(f"Rejected spans: {reader.rejected}")
+    reader.close()
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
@@ -0,0 +1,185 @@
+"""
+Publish/subscribe fan-out of detected frames to several consumers.
+
+The detector still fills one FramePool slot per frame; the bus hands the same
+slot index to every subscriber instead of copying the pixels. A slot goes
+back to the pool once every subscriber holding it has released it. Each
+subscriber has its own queue and drop policy, and the bus never waits on a
+subscriber, so a slow one only loses frames itself.
+"""
+
+import time
+from multiprocessing import Event, Queue, Value, shared_memory
+from queue import Empty, Full
+
+import numpy as np
+
+POLICY_ALL = "all"  # Queue up to maxsize frames, drop new ones beyond that
+POLICY_LATEST = "latest"  # Keep only the newest frame, replacing an unread one
+RECLAIM_INTERVAL = 0.005  # Seconds between checks for released slots when idle
+
+
+class Subscription:
+    """
+    One subscriber's end of the bus, picklable for handing to a Process.
+
+    get() returns slot indices of the shared FramePool; every slot received
+    must be given back with release() once the subscriber is done with it.
+
+    A POLICY_LATEST subscriber has a single shared cell instead of a queue,
+    so the bus can swap an unread frame for a newer one under the cell's
+    lock; taking it back out of a Queue fails while the queue's feeder thread
+    still holds it.
+    """
+
+    def __init__(self, bus_name, index, n_subs, n_slots, name, policy, maxsize):
+        self.bus_name = bus_name
+        self.index = index
+        self.n_subs = n_subs
+        self.n_slots = n_slots
+        self.name = name
+        self.policy = policy
+        if policy == POLICY_LATEST:
+            self.latest = Value("q", -1)  # Unread slot, -1 when none
+            self.ready = Event()  # Set when latest was filled
+        else:
+            self.queue = Queue(maxsize=maxsize)
+        self._shm = None
+        self._holds = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_shm"] = state["_holds"] = None
+        return state
+
+    def _attach(self):
+        if self._holds is None:
+            self._shm = shared_memory.SharedMemory(name=self.bus_name)
+            holds = np.ndarray(
+                (self.n_subs, self.n_slots), dtype=np.uint8, buffer=self._shm.buf
+            )
+            self._holds = holds[self.index]
+        return self._holds
+
+    def get(self, timeout=None):
+        """Next slot for this subscriber, raises queue.Empty on timeout"""
+        if self.policy != POLICY_LATEST:
+            return self.queue.get(timeout=timeout)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            slot = self.swap(-1)
+            if slot >= 0:
+                return slot
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise Empty
+            self.ready.wait(remaining)
+
+    def swap(self, slot):
+        """Put slot in the POLICY_LATEST cell, return the unread one or -1"""
+        with self.latest.get_lock():
+            old = self.latest.value
+            self.latest.value = slot
+            if slot < 0:
+                self.ready.clear()
+        if slot >= 0:
+            self.ready.set()
+        return old
+
+    def release(self, slot):
+        self._attach()[slot] = 0
+
+    def close(self):
+        if self._shm is not None:
+            self._holds = None
+            self._shm.close()
+            self._shm = None
+
+
+class FrameBus:
+    """
+    Distributes the detector's frame slots to subscribers.
+
+    Args:
+        pool: The FramePool the detector writes into, owned by this process
+        subscribers: (name, policy, maxsize) per subscriber
+    """
+
+    def __init__(self, pool, subscribers):
+        self.pool = pool
+        n_subs, n_slots = len(subscribers), len(pool.meta)
+        # holds[s, slot] is set by the bus and cleared by subscriber s
+        self.shm = shared_memory.SharedMemory(
+            create=True, size=max(n_subs * n_slots, 1)
+        )
+        self.holds = np.ndarray((n_subs, n_slots), dtype=np.uint8, buffer=self.shm.buf)
+        self.holds[:] = 0
+        self.subscriptions = [
+            Subscription(self.shm.name, i, n_subs, n_slots, name, policy, maxsize)
+            for i, (name, policy, maxsize) in enumerate(subscribers)
+        ]
+        self.delivered = np.zeros(n_subs, dtype=np.int64)
+        self.dropped = np.zeros(n_subs, dtype=np.int64)
+        self.pending = set()  # Slots handed out and not yet returned to the pool
+
+    def subscription(self, name):
+        for sub in self.subscriptions:
+            if sub.name == name:
+                return sub
+        raise KeyError(name)
+
+    def _publish(self, slot):
+        for i, sub in enumerate(self.subscriptions):
+            self.holds[i, slot] = 1
+            if sub.policy == POLICY_LATEST:
+                # Take back the unread frame, if the subscriber has not yet
+                old = sub.swap(slot)
+                if old >= 0:
+                    self.holds[i, old] = 0
+                    self.dropped[i] += 1
+                else:
+                    self.delivered[i] += 1
+                continue
+            try:
+                sub.queue.put_nowait(slot)
+                self.delivered[i] += 1
+            except Full:
+                self.holds[i, slot] = 0
+                self.dropped[i] += 1
+        self.pending.add(slot)
+
+    def _reclaim(self):
+        if not self.pending:
+            return
+        slots = np.fromiter(self.pending, dtype=np.int64)
+        free = slots[~self.holds[:, slots].any(axis=0)]
+        for slot in free.tolist():
+            self.pool.release(slot)
+            self.pending.discard(slot)
+
+    def run(self, frame_queue, stop, stats=None):
+        """Distributor loop, run in a thread of the pool's owner process"""
+        while not stop.is_set():
+            try:
+                slot = frame_queue.get(timeout=RECLAIM_INTERVAL)
+            except Empty:
+                self._reclaim()
+                continue
+            dropped = self.dropped.sum()
+            self._publish(slot)
+            self._reclaim()
+            if stats is not None:
+                stats.add("bus_frames_dropped", self.dropped.sum() - dropped)
+
+    def summary(self):
+        """One line per subscriber with delivered and dropped frame counts"""
+        return "\n".join(
+            f"  {sub.name:<12} {sub.policy:<7} delivered {self.delivered[i]:8d} "
+            f"dropped {self.dropped[i]:8d}"
+            for i, sub in enumerate(self.subscriptions)
+        )
+
+    def close(self):
+        self.holds = None
+        self.shm.close()
+        self.shm.unlink()
@@ -0,0 +1,151 @@
+"""
+Single-pass pixel decoders writing BGR straight into caller-supplied buffers,
+ready for cv2.imshow() without any further copy.
+"""
+
+import numpy as np, cv2
+
+
+def _rgb565_bgr_lut(byteorder):
+    """65536-entry table mapping a 16-bit word, as read natively, to B, G, R"""
+    v = np.arange(65536, dtype=np.uint32)
+    if byteorder == "big":
+        v = ((v & 0xFF) << 8) | (v >> 8)
+    lut = np.empty((65536, 3), dtype=np.uint8)
+    lut[:, 0] = (v & 0x1F) << 3  # B
+    lut[:, 1] = ((v >> 5) & 0x3F) << 2  # G
+    lut[:, 2] = ((v >> 11) & 0x1F) << 3  # R
+    return lut
+
+
+# Only needed for big-endian streams, OpenCV handles little-endian natively
+RGB565_BE_LUT = _rgb565_bgr_lut("big")
+
+
+def decode_rgb565_bgr(frame, out, byteorder="little"):
+    """
+    Decode one RGB565 frame into out.
+
+    Args:
+        frame: Buffer of H*W*2 bytes
+        out: Preallocated uint8 array of shape (H, W, 3), receives B, G, R
+        byteorder: "little" if the low byte of each pixel comes first
+
+    Returns:
+        out
+    """
+    h, w = out.shape[:2]
+    pix = np.frombuffer(frame, dtype=np.uint8)
+    if byteorder == "little":
+        # OpenCV's BGR565 has R in the top five bits, same as the sensor
+        cv2.cvtColor(pix.reshape(h, w, 2), cv2.COLOR_BGR5652BGR, dst=out)
+    else:
+        np.take(RGB565_BE_LUT, pix.view(np.uint16), axis=0, out=out.reshape(-1, 3))
+    return out
+
+
+def decode_rgb565_bgr_batch(frames, out, byteorder="little"):
+    """
+    Decode N stacked RGB565 frames in one call.
+
+    Args:
+        frames: Buffer or array holding N*H*W*2 contiguous bytes
+        out: Preallocated uint8 array of shape (N, H, W, 3)
+        byteorder: "little" if the low byte of each pixel comes first
+
+    Returns:
+        out
+    """
+    n, h, w = out.shape[:3]
+    # The frames are stacked rows of one tall image as far as OpenCV is concerned
+    decode_rgb565_bgr(frames, out.reshape(n * h, w, 3), byteorder)
+    return out
+
+
+# OpenCV names Bayer codes after the second row's first two pixels, so a
+# sensor pattern maps to the code of its diagonal neighbour
+BAYER_TO_BGR = {
+    "BGGR": cv2.COLOR_BayerRG2BGR,
+    "GBRG": cv2.COLOR_BayerGR2BGR,
+    "GRBG": cv2.COLOR_BayerGB2BGR,
+    "RGGB": cv2.COLOR_BayerBG2BGR,
+}
+
+YUV422_TO_BGR = {
+    "YUYV": cv2.COLOR_YUV2BGR_YUYV,
+    "YVYU": cv2.COLOR_YUV2BGR_YVYU,
+    "UYVY": cv2.COLOR_YUV2BGR_UYVY,
+}
+
+
+def decode_yuv422_bgr(frame, out, order="YUYV"):
+    """
+    Decode one packed YUV422 frame into out.
+
+    Args:
+        frame: Buffer of H*W*2 bytes
+        out: Preallocated uint8 array of shape (H, W, 3), receives B, G, R
+        order: Byte order of each pixel pair, "YUYV", "YVYU", "UYVY" or "VYUY"
+
+    Returns:
+        out
+    """
+    h, w = out.shape[:2]
+    pix = np.frombuffer(frame, dtype=np.uint8).reshape(h, w, 2)
+    if order == "VYUY":
+        # No OpenCV code for it, swapping the bytes of every word gives YVYU
+        pix = pix.view(np.uint16).byteswap().view(np.uint8)
+        order = "YVYU"
+    cv2.cvtColor(pix, YUV422_TO_BGR[order], dst=out)
+    return out
+
+
+def decode_y8_bgr(frame, out):
+    """Expand one 8-bit luma frame of H*W bytes into the grey BGR array out"""
+    h, w = out.shape[:2]
+    pix = np.frombuffer(frame, dtype=np.uint8).reshape(h, w)
+    cv2.cvtColor(pix, cv2.COLOR_GRAY2BGR, dst=out)
+    return out
+
+
+def decode_raw8_bgr(frame, out, pattern="BGGR"):
+    """
+    Demosaic one 8-bit Bayer frame into out.
+
+    Args:
+        frame: Buffer of H*W bytes
+        out: Preallocated uint8 array of shape (H, W, 3), receives B, G, R
+        pattern: Colour order of the sensor's top-left 2x2 block
+
+    Returns:
+        out
+    """
+    h, w = out.shape[:2]
+    pix = np.frombuffer(frame, dtype=np.uint8).reshape(h, w)
+    cv2.cvtColor(pix, BAYER_TO_BGR[pattern], dst=out)
+    return out
+
+
+def decode_frame_bgr(frame, out, pixel_format, order=None, byteorder="little"):
+    """
+    Decode one frame of any supported stream format into out.
+
+    Args:
+        frame: Buffer of one frame's pixel bytes
+        out: Preallocated uint8 array of shape (H, W, 3)
+        pixel_format: "RGB565", "YUV422", "RAW8" or "Y8"
+        order: YUV422 byte order or Bayer pattern, defaults if None
+        byteorder: RGB565 byte order
+
+    Returns:
+        out
+    """
+    if pixel_format == "RGB565":
+        return decode_rgb565_bgr(frame, out, byteorder)
+    if pixel_format == "YUV422":
+        return decode_yuv422_bgr(frame, out, order or "YUYV")
+    if pixel_format == "RAW8":
+        return decode_raw8_bgr(frame, out, order or "BGGR")
+    if pixel_format == "Y8":
+        return decode_y8_bgr(frame, out)
+    raise ValueError(f"Unsupported pixel format {pixel_format!r}")
@@ -0,0 +1,291 @@
+"""
+Parallel per-frame CV stage between the detector and the display.
+
+A pool of worker processes decodes frames straight from their FramePool slot,
+runs a chain of per-frame functions and writes the image into a slot of a
+separate result pool. Results come back in whatever order the workers finish
+and are put back into frame order before they are published on the stage's
+own FrameBus, so the display sees a steady sequence while the work is spread
+across cores.
+
+A processor is the name of an entry in PROCESSORS or a "module:function"
+spec. It takes the BGR frame and returns a uint8 image of the same size, gray
+or BGR. Classes are instantiated once per worker; since every worker only
+sees a share of the frames, stateful processors such as "motion" learn from
+an interleaved subset of the stream.
+"""
+
+import importlib
+import os
+import threading
+import time
+from multiprocessing import Process, Queue
+from queue import Empty
+from queue import Queue as ThreadQueue
+
+import numpy as np, cv2
+
+from frame_bus import FrameBus, POLICY_LATEST
+from frame_decode import decode_frame_bgr
+from shared_buffers import FramePool
+from smooth_stream import (
+    BYTE_ORDER,
+    FRAME_SLOTS,
+    H,
+    PIXEL_FORMAT,
+    PIXEL_ORDER,
+    W,
+    ignore_sigint,
+)
+
+# Leave a core each to the reader and the detector
+PROCESS_WORKERS = max(1, (os.cpu_count() or 2) - 2)
+REORDER_WINDOW = 8  # Finished frames held back for a slower earlier one
+RESULT_SLOTS = 32  # Shared result images
+# Detector slots the workers may hold, the rest stay with the other consumers
+MAX_IN_FLIGHT = min(2 * PROCESS_WORKERS, FRAME_SLOTS // 2)
+
+
+def to_gray(bgr):
+    return cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY)
+
+
+def canny_edges(bgr):
+    return cv2.Canny(to_gray(bgr), 50, 150)
+
+
+class MotionMask:
+    """Foreground mask from a per-worker MOG2 background model"""
+
+    def __init__(self):
+        self.subtractor = cv2.createBackgroundSubtractorMOG2(detectShadows=False)
+
+    def __call__(self, bgr):
+        return self.subtractor.apply(bgr)
+
+
+PROCESSORS = {
+    "gray": to_gray,
+    "edges": canny_edges,
+    "motion": MotionMask,
+}
+
+
+def load_processor(spec):
+    """Per-frame function for a PROCESSORS name or a "module:function" spec"""
+    if spec in PROCESSORS:
+        func = PROCESSORS[spec]
+    else:
+        module, sep, attr = spec.partition(":")
+        if not sep:
+            raise ValueError(f"Unknown processor '{spec}'")
+        func = getattr(importlib.import_module(module), attr)
+    return func() if isinstance(func, type) else func
+
+
+def result_image(pool, slot):
+    """View of a processed image in its result slot, gray or BGR"""
+    length = int(pool.meta["length"][slot])
+    data = pool.frame(slot)[:length]
+    if length == W * H:
+        return data.reshape(H, W)
+    return data.reshape(H, W, 3)
+
+
+def processing_worker(pool_name, results_name, chain, tasks, done):
+    """
+    Worker process: frame slot in, processed image in a result slot out.
+
+    Timing and failures go back with the result, the collector thread counts
+    them, as the stats fields are not safe to update from several workers.
+    """
+    ignore_sigint()
+    pool = FramePool.attach(pool_name)
+    results = FramePool.attach(results_name)
+    funcs = [load_processor(spec) for spec in chain]
+    frame_bgr = np.empty((H, W, 3), dtype=np.uint8)
+
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            ticket, slot, rslot = task
+            ok = False
+            seconds = 0.0
+            try:
+                t0 = time.perf_counter()
+                decode_frame_bgr(
+                    pool.frame(slot), frame_bgr, PIXEL_FORMAT, PIXEL_ORDER, BYTE_ORDER
+                )
+                image = frame_bgr
+                for func in funcs:
+                    image = func(image)
+                image = np.ascontiguousarray(image, dtype=np.uint8)
+                if image.shape not in ((H, W), (H, W, 3)):
+                    raise ValueError(f"Processor returned shape {image.shape}")
+
+                results.frame(rslot)[: image.nbytes] = image.reshape(-1)
+                meta = results.meta[rslot]
+                src = pool.meta[slot]
+                for field in ("seq", "flags", "t_arrival", "t_detected"):
+                    meta[field] = src[field]
+                meta["length"] = image.nbytes
+                seconds = time.perf_counter() - t0
+                ok = True
+            except Exception:
+                pass  # Counted by the collector
+            done.put((ticket, slot, rslot, ok, seconds))
+    finally:
+        pool.close()
+        results.close()
+
+
+class ProcessingStage:
+    """
+    Worker pool and reorder buffer, fed by a frame bus subscription.
+
+    Args:
+        pool: The detector's FramePool
+        stats: PipelineStats of the pipeline
+        chain: Processor specs applied in order to every frame
+        subscribers: (name, policy, maxsize) per consumer of the results
+        workers: Worker processes
+        window: Finished frames held back waiting for an earlier one; when
+            exceeded the missing frame is given up on and dropped if it
+            finishes later
+    """
+
+    def __init__(
+        self,
+        pool,
+        stats,
+        chain,
+        subscribers=(("display", POLICY_LATEST, 1),),
+        workers=PROCESS_WORKERS,
+        window=REORDER_WINDOW,
+    ):
+        self.pool = pool
+        self.stats = stats
+        self.chain = tuple(chain)
+        self.n_workers = workers
+        self.window = window
+        self.results = FramePool.create(RESULT_SLOTS, W * H * 3)
+        self.bus = FrameBus(self.results, list(subscribers))
+        self.tasks = Queue()
+        self.done = Queue()
+        self.output = ThreadQueue()
+        self.in_flight = threading.Semaphore(min(2 * workers, MAX_IN_FLIGHT))
+        self.workers = []
+        self.threads = []
+        self.late = 0  # Frames finished after the reorder window gave up on them
+
+    def subscription(self, name):
+        return self.bus.subscription(name)
+
+    def start(self, sub, stop):
+        """Process frames from bus subscription sub until stop is set"""
+        self.sub = sub
+        self.stop = stop
+        self.workers = [
+            Process(
+                target=processing_worker,
+                args=(
+                    self.pool.name,
+                    self.results.name,
+                    self.chain,
+                    self.tasks,
+                    self.done,
+                ),
+            )
+            for _ in range(self.n_workers)
+        ]
+        for proc in self.workers:
+            proc.start()
+        self.threads = [
+            threading.Thread(target=self._dispatch, daemon=True),
+            threading.Thread(target=self._collect, daemon=True),
+            threading.Thread(
+                target=self.bus.run, args=(self.output, stop, None), daemon=True
+            ),
+        ]
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def _dispatch(self):
+        """Hand frames to the workers in arrival order, numbered by ticket"""
+        ticket = 0
+        while not self.stop.is_set():
+            # Busy workers leave frames to the subscription's drop policy
+            if not self.in_flight.acquire(timeout=0.5):
+                continue
+            try:
+                slot = self.sub.get(timeout=0.5)
+            except Empty:
+                self.in_flight.release()
+                continue
+            rslot = self.results.acquire()
+            if rslot < 0:
+                # Consumers hold every result slot, skip rather than stall
+                self.sub.release(slot)
+                self.in_flight.release()
+                self.stats.add("processor_frames_skipped")
+                continue
+            self.tasks.put((ticket, slot, rslot))
+            ticket += 1
+
+    def _collect(self):
+        """Put finished frames back in ticket order and publish them"""
+        next_ticket = 0
+        pending = {}  # ticket -> result slot, -1 for a failed frame
+        while not self.stop.is_set():
+            try:
+                ticket, slot, rslot, ok, seconds = self.done.get(timeout=0.5)
+            except Empty:
+                continue
+            self.sub.release(slot)
+            self.in_flight.release()
+            if ok:
+                self.stats.add("processor_seconds", seconds)
+            else:
+                self.stats.add("processor_errors")
+                self.results.release(rslot)
+                rslot = -1
+            if ticket < next_ticket:
+                if rslot >= 0:
+                    self.results.release(rslot)
+                    self.late += 1
+                    self.stats.add("processor_frames_late")
+                continue
+            pending[ticket] = rslot
+
+            while pending:
+                if next_ticket not in pending:
+                    if len(pending) <= self.window:
+                        break
+                    # Give up on the frames still missing before the oldest done
+                    next_ticket = min(pending)
+                rslot = pending.pop(next_ticket)
+                next_ticket += 1
+                if rslot >= 0:
+                    self.output.put(rslot)
+                    self.stats.add("processor_frames")
+
+    def close(self):
+        """Stop the workers and free the result pool"""
+        self.stop.set()
+        for thread in self.threads:
+            thread.join(timeout=1)
+        for _ in self.workers:
+            self.tasks.put(None)
+        for proc in self.workers:
+            proc.join(timeout=2)
+            if proc.is_alive():
+                proc.terminate()
+        print("Processing output:")
+        print(self.bus.summary())
+        if self.late:
+            print(f"  {self.late} frames finished outside the reorder window")
+        self.bus.close()
+        self.results.close()
@@ -0,0 +1,118 @@
+"""
+Append-only raw frame container for headless recording.
+
+A recording is a pair of files:
+    <path>.frames  4 KB header (magic, version, JSON metadata), then every
+                   frame's raw bytes at a 4 KB aligned offset
+    <path>.idx     Packed INDEX_DTYPE records, one per frame, in write order
+"""
+
+import json
+import os
+import time
+
+import numpy as np
+
+RECORDING_MAGIC = b"GWFRAMES"
+RECORDING_VERSION = 1
+HEADER_BYTES = 4096
+ALIGN = 4096  # Frame offsets and strides are multiples of this
+INDEX_FLUSH = 256  # Index records buffered before they are appended
+
+INDEX_DTYPE = np.dtype(
+    [
+        ("frame", "<u8"),  # Detector frame number, gaps mean skipped frames
+        ("offset", "<u8"),  # Byte offset of the frame in the .frames file
+        ("timestamp", "<f8"),  # Capture time, seconds since the epoch
+        ("flags", "<u4"),  # FRAME_PADDED / FRAME_TRIMMED
+        ("length", "<u4"),  # Frame length on the wire, marker included
+    ]
+)
+
+
+class FrameRecorder:
+    """
+    Writes frames with one unbuffered, aligned write per frame straight from
+    the caller's memory (e.g. a FramePool slot), so nothing is copied on the
+    way to the page cache.
+
+    Args:
+        path: Recording path without extension
+        frame_size: Bytes per frame
+        metadata: Extra JSON-serialisable fields for the header (width, height, ...)
+    """
+
+    def __init__(self, path, frame_size, metadata=None):
+        self.path = path
+        self.frame_size = frame_size
+        self.stride = (frame_size + ALIGN - 1) // ALIGN * ALIGN
+        self.pad = bytes(self.stride - frame_size)
+
+        # Capture times arrive as perf_counter() values, keep one reference
+        # pair to turn them into wall clock time
+        self.t_wall0 = time.time()
+        self.t_perf0 = time.perf_counter()
+
+        header = dict(metadata or {})
+        header.update(
+            frame_size=frame_size,
+            stride=self.stride,
+            data_offset=HEADER_BYTES,
+            created=self.t_wall0,
+        )
+        blob = json.dumps(header).encode("utf-8")
+        if len(blob) > HEADER_BYTES - 16:
+            raise ValueError("Recording metadata does not fit in the header")
+
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+        self.f = open(path + ".frames", "wb", buffering=0)
+        self._write_all(
+            RECORDING_MAGIC
+            + np.array([RECORDING_VERSION, len(blob)], dtype="<u4").tobytes()
+            + blob.ljust(HEADER_BYTES - 16, b"\x00")
+        )
+        self.idx = open(path + ".idx", "wb")
+        self.pending = np.zeros(INDEX_FLUSH, dtype=INDEX_DTYPE)
+        self.n_pending = 0
+        self.offset = HEADER_BYTES
+        self.frames = 0
+
+    def _write_all(self, data):
+        view = memoryview(data).cast("B")
+        done = 0
+        while done < view.nbytes:
+            done += self.f.write(view[done:])
+
+    def write(self, frame, frame_number, t_capture, flags=0, length=0):
+        """Append one frame of frame_size bytes, t_capture is a perf_counter() time"""
+        self._write_all(frame)
+        if self.pad:
+            self._write_all(self.pad)
+
+        rec = self.pending[self.n_pending]
+        rec["frame"] = frame_number
+        rec["offset"] = self.offset
+        rec["timestamp"] = self.t_wall0 + (t_capture - self.t_perf0)
+        rec["flags"] = flags
+        rec["length"] = length
+        self.n_pending += 1
+        if self.n_pending == INDEX_FLUSH:
+            self.flush_index()
+
+        self.offset += self.stride
+        self.frames += 1
+
+    def flush_index(self):
+        """Append the buffered index records to the .idx file"""
+        if self.n_pending:
+            self.idx.write(self.pending[: self.n_pending].tobytes())
+            self.idx.flush()
+            self.n_pending = 0
+
+    def close(self):
+        self.flush_index()
+        self.idx.close()
+        self.f.close()
@@ -0,0 +1,148 @@
+"""
+Line-granular repair of frames that arrived a few bytes short or long.
+
+The stream carries no line sync, but every line is exactly line_bytes long,
+so bytes lost or duplicated somewhere in a frame shift every following line
+horizontally. Lines before the damage are correct counted from the frame
+start, lines after it are correct counted back from the marker. The damage
+shows up as the one line boundary where neighbouring lines stop matching;
+the lines around it are replaced and the rest realigned, so no sheared
+lines are ever shown.
+"""
+
+import numpy as np
+
+from marker_scanner import MARKER_VALUE
+
+REPAIR_MAX_LINES = 16  # Most bytes lost or duplicated that are repaired, in lines
+REPAIR_MIN_CONTRAST = 4.0  # Damaged line boundary vs median line difference
+
+
+def find_damage(data, line_bytes):
+    """
+    Locate the line boundary where a frame's lines stop matching.
+
+    Args:
+        data: Received pixel bytes, counted from the frame start
+        line_bytes: Bytes per line
+
+    Returns:
+        Index of the first line after the boundary, or -1 if no boundary
+        stands out clearly enough to repair without guessing
+    """
+    n_lines = len(data) // line_bytes
+    if n_lines < 4:
+        return -1
+    rows = np.frombuffer(data, dtype=np.uint8)[: n_lines * line_bytes]
+    rows = rows.reshape(n_lines, line_bytes).astype(np.int16)
+
+    # Mean absolute difference between each line and the one above
+    diff = np.abs(rows[1:] - rows[:-1]).mean(axis=1)
+    boundary = int(np.argmax(diff))
+    typical = np.median(diff)
+    if diff[boundary] < REPAIR_MIN_CONTRAST * max(typical, 1.0):
+        return -1
+    return boundary + 1
+
+
+def marker_overrun(before):
+    """
+    Marker-valued bytes at the end of before, the bytes ahead of a marker's
+    last MARKER_BYTES: how far the marker ran into the next frame, at most.
+    """
+    other = np.frombuffer(before, dtype=np.uint8) != MARKER_VALUE
+    return (
+        len(other) - 1 - int(np.flatnonzero(other)[-1]) if other.any() else len(other)
+    )
+
+
+def marker_jitter(data, frame_size, late_start):
+    """
+    Whether a frame less than a line off was only displaced by its markers.
+
+    Pixel bytes of the marker value right after a marker are counted into
+    it, so the frame before ends late and the frame after starts late by as
+    many bytes. A long frame then ends in the first bytes of its marker, a
+    short one lacks no more than its opening marker overran. Content repair
+    would shift such frames although their pixels are intact.
+
+    Args:
+        data: Received pixel bytes, marker excluded
+        frame_size: Exact frame size
+        late_start: marker_overrun() of the marker opening the frame
+    """
+    data = np.frombuffer(data, dtype=np.uint8)
+    extra = data.size - frame_size
+    if extra > 0:
+        return bool(np.all(data[frame_size:] == MARKER_VALUE))
+    return extra < 0 and -extra <= late_start
+
+
+def fit_to_markers(data, out):
+    """
+    Cut a frame found by marker_jitter() at its end, or pad it at its start
+    with the marker value, to len(out) bytes.
+
+    Returns:
+        Bytes padded, negative for bytes cut
+    """
+    data = np.frombuffer(data, dtype=np.uint8)
+    short = out.size - data.size
+    if short > 0:
+        out[:short] = MARKER_VALUE
+        out[short:] = data
+    else:
+        out[:] = data[: out.size]
+    return short
+
+
+def repair_frame(data, out, line_bytes, split=None):
+    """
+    Rebuild a frame of len(out) bytes from data, which is a few bytes off.
+
+    Args:
+        data: Received pixel bytes, marker excluded
+        out: Destination uint8 array of the exact frame size
+        line_bytes: Bytes per line
+        split: Byte offset in data where bytes went missing, if known (e.g. a
+            ring overflow gap); found from the image content otherwise
+
+    Returns:
+        The number of lines replaced, or -1 if the frame cannot be repaired
+    """
+    data = np.frombuffer(data, dtype=np.uint8)
+    frame_size = out.size
+    n_lines = frame_size // line_bytes
+    lost = frame_size - data.size  # Negative when bytes were duplicated
+    if lost == 0 or abs(lost) > REPAIR_MAX_LINES * line_bytes:
+        return -1
+
+    # Bytes past the split are still suspect, up to where the damage may end
+    margin = line_bytes
+    if split is None:
+        line = find_damage(data, line_bytes)
+        if line < 0:
+            return -1
+        # The damaged line is one of the two either side of the boundary
+        split = (line - 1) * line_bytes
+        margin = 2 * line_bytes
+    if not 0 <= split <= min(data.size, frame_size):
+        return -1
+
+    # Head counted from the frame start, tail counted back from the marker
+    out[:split] = data[:split]
+    if lost > 0:
+        out[split + lost :] = data[split:]
+    else:
+        out[split:] = data[split - lost :]
+    damaged_end = split + max(lost, 0) + margin
+
+    # Replace every line touched by the damage with the last intact line above
+    first = split // line_bytes
+    last = min(-(-damaged_end // line_bytes), n_lines)
+    lines = out[: n_lines * line_bytes].reshape(n_lines, line_bytes)
+    if first > 0:
+        lines[first:last] = lines[first - 1]
+    else:
+        lines[:last] = 0
+    return last - first
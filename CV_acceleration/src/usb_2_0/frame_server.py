@@ -0,0 +1,426 @@
+"""
+HTTP frame server subscribed to the detector output.
+
+Endpoints:
+    /mjpeg          multipart/x-mixed-replace JPEG stream, viewable in a browser
+    /raw            Continuous raw frames, each behind a RAW_HEADER
+    /snapshot.jpg   The latest frame as a single JPEG
+    /stats          Per-client throughput and latency as JSON
+
+JPEG encoding runs in a process pool whose workers read the frame straight
+from its shared FramePool slot. Every client sends the newest frame when it
+is ready for one and skips anything it was too slow for, so a slow viewer
+never holds back the others or the pipeline.
+"""
+
+import json
+import socket
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from queue import Empty
+
+import numpy as np, cv2
+
+from frame_decode import decode_frame_bgr
+from pipeline_stats import PipelineStats
+from shared_buffers import FramePool
+from smooth_stream import (
+    BYTE_ORDER,
+    H,
+    PIXEL_FORMAT,
+    PIXEL_ORDER,
+    W,
+    ignore_sigint,
+)
+
+SERVER_HOST = "127.0.0.1"  # "0.0.0.0" to serve the local network
+SERVER_PORT = 8080
+ENCODER_WORKERS = 4  # JPEG encoder processes, also the most frames in flight
+JPEG_QUALITY = 80
+CLIENT_SNDBUF = 256 * 1024  # Socket send buffer, bounds frames queued in the kernel
+CLIENT_TIMEOUT = 5.0  # Seconds a client may wait for a frame before giving up
+LATENCY_WINDOW = 512  # Frames per client kept for latency percentiles
+
+# magic, width, height, seq, length, flags, t_detected (perf_counter())
+RAW_HEADER = struct.Struct("<4sIIQIId")
+RAW_MAGIC = b"GWRF"
+MJPEG_BOUNDARY = "gwframe"
+
+
+# --- Encoder workers ---
+_worker_pool = None
+_worker_bgr = None
+
+
+def _encoder_init(pool_name):
+    global _worker_pool, _worker_bgr
+    ignore_sigint()
+    _worker_pool = FramePool.attach(pool_name)
+    _worker_bgr = np.empty((H, W, 3), dtype=np.uint8)
+
+
+def _encode_jpeg(slot, quality):
+    """Encode one pool slot, runs in an encoder process"""
+    decode_frame_bgr(
+        _worker_pool.frame(slot), _worker_bgr, PIXEL_FORMAT, PIXEL_ORDER, BYTE_ORDER
+    )
+    ok, jpeg = cv2.imencode(".jpg", _worker_bgr, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise RuntimeError("JPEG encoding failed")
+    return jpeg.tobytes()
+
+
+def _encoder_ready():
+    """Warm-up task, returns once an encoder process is up"""
+    return True
+
+
+class LatestFrame:
+    """
+    Newest published payload, shared by all clients of one kind.
+
+    Each client remembers the last seq it sent and waits for a newer one, so
+    a client that falls behind simply skips to the newest frame.
+    """
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.seq = -1
+        self.payload = None
+        self.t_detected = 0.0
+        self.clients = 0
+
+    def put(self, seq, payload, t_detected):
+        with self.cond:
+            # Encoders may finish out of order, never go back in time
+            if seq <= self.seq:
+                return
+            self.seq, self.payload, self.t_detected = seq, payload, t_detected
+            self.cond.notify_all()
+
+    def wait_newer(self, seq, timeout=CLIENT_TIMEOUT):
+        """(seq, payload, t_detected) newer than seq, or None on timeout"""
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.seq > seq, timeout):
+                return None
+            return self.seq, self.payload, self.t_detected
+
+
+class ClientStats:
+    """Throughput and detector-to-socket latency of one client"""
+
+    def __init__(self, peer, kind):
+        self.peer = peer
+        self.kind = kind
+        self.t_start = time.perf_counter()
+        self.t_end = None  # Set when the client leaves
+        self.frames = 0
+        self.bytes = 0
+        self.skipped = 0  # Newer frames published while this client was busy
+        self.latency = np.full(LATENCY_WINDOW, np.nan)
+
+    def sent(self, nbytes, t_detected, skipped):
+        self.latency[self.frames % LATENCY_WINDOW] = time.perf_counter() - t_detected
+        self.frames += 1
+        self.bytes += nbytes
+        self.skipped += skipped
+
+    def left(self):
+        self.t_end = time.perf_counter()
+
+    def report(self):
+        t_end = self.t_end if self.t_end is not None else time.perf_counter()
+        dt = max(t_end - self.t_start, 1e-9)
+        lat = self.latency[~np.isnan(self.latency)] * 1e3
+        p50, p95 = np.percentile(lat, (50, 95)) if lat.size else (0.0, 0.0)
+        return {
+            "peer": self.peer,
+            "kind": self.kind,
+            "seconds": dt,
+            "frames": self.frames,
+            "skipped": self.skipped,
+            "fps": self.frames / dt,
+            "mb_s": self.bytes / dt / 1024 / 1024,
+            "latency_p50_ms": float(p50),
+            "latency_p95_ms": float(p95),
+        }
+
+
+class FrameServer:
+    """
+    Feeds the latest raw and JPEG frames to HTTP clients.
+
+    Args:
+        host, port: Address to listen on, port 0 picks a free one
+        stats: PipelineStats to publish the client count to, if any
+    """
+
+    def __init__(self, host=SERVER_HOST, port=SERVER_PORT, stats=None):
+        self.stats_block = stats
+        self.raw = LatestFrame()
+        self.jpeg = LatestFrame()
+        self.clients = []
+        self.finished = []
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                path = self.path.split("?")[0]
+                if path == "/mjpeg":
+                    server._serve_mjpeg(self)
+                elif path == "/raw":
+                    server._serve_raw(self)
+                elif path == "/snapshot.jpg":
+                    server._serve_snapshot(self)
+                elif path == "/stats":
+                    body = json.dumps(server.stats(), indent=2).encode("utf-8")
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                else:
+                    self.send_error(404)
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.address = self.httpd.server_address
+
+    def wants_jpeg(self):
+        return self.jpeg.clients > 0
+
+    def wants_raw(self):
+        return self.raw.clients > 0
+
+    def _count_clients(self):
+        if self.stats_block is not None:
+            self.stats_block.set("server_clients", len(self.clients))
+
+    def stats(self):
+        with self.lock:
+            return {
+                "active": [c.report() for c in self.clients],
+                "finished": [c.report() for c in self.finished[-32:]],
+            }
+
+    def _stream(self, handler, latest, kind, write_frame):
+        """Send every newest frame to one client until it disconnects"""
+        # Keep the kernel from buffering frames a slow client is not reading
+        handler.connection.setsockopt(
+            socket.SOL_SOCKET, socket.SO_SNDBUF, CLIENT_SNDBUF
+        )
+        client = ClientStats(
+            f"{handler.client_address[0]}:{handler.client_address[1]}", kind
+        )
+        with self.lock:
+            self.clients.append(client)
+            latest.clients += 1
+            self._count_clients()
+        # Start from the next frame, not whatever was published long ago
+        seq = latest.seq
+        try:
+            while not self.stopping.is_set():
+                item = latest.wait_newer(seq)
+                if item is None:
+                    continue
+                new_seq, payload, t_detected = item
+                skipped = new_seq - seq - 1 if client.frames else 0
+                seq = new_seq
+                nbytes = write_frame(seq, payload, t_detected)
+                client.sent(nbytes, t_detected, skipped)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            client.left()
+            with self.lock:
+                latest.clients -= 1
+                self.clients.remove(client)
+                self.finished.append(client)
+                self._count_clients()
+            r = client.report()
+            print(
+                f"Client {r['peer']} ({kind}) left: {r['frames']} frames, "
+                f"{r['fps']:.1f} fps, {r['mb_s']:.2f} MB/s, skipped {r['skipped']}, "
+                f"latency p50 {r['latency_p50_ms']:.1f} ms p95 {r['latency_p95_ms']:.1f} ms",
+                flush=True,
+            )
+
+    def _serve_mjpeg(self, handler):
+        handler.send_response(200)
+        handler.send_header(
+            "Content-Type", f"multipart/x-mixed-replace; boundary={MJPEG_BOUNDARY}"
+        )
+        handler.send_header("Cache-Control", "no-cache")
+        handler.end_headers()
+
+        def write_frame(seq, jpeg, t_detected):
+            part = (
+                (
+                    f"--{MJPEG_BOUNDARY}\r\n"
+                    "Content-Type: image/jpeg\r\n"
+                    f"Content-Length: {len(jpeg)}\r\n"
+                    f"X-Frame-Seq: {seq}\r\n"
+                    f"X-Frame-Detected: {t_detected:.6f}\r\n\r\n"
+                ).encode("ascii")
+                + jpeg
+                + b"\r\n"
+            )
+            handler.wfile.write(part)
+            return len(part)
+
+        self._stream(handler, self.jpeg, "mjpeg", write_frame)
+
+    def _serve_raw(self, handler):
+        handler.send_response(200)
+        handler.send_header("Content-Type", "application/octet-stream")
+        handler.send_header("X-Pixel-Format", PIXEL_FORMAT)
+        handler.send_header("X-Frame-Size", f"{W}x{H}")
+        handler.end_headers()
+
+        def write_frame(seq, payload, t_detected):
+            flags, data = payload
+            handler.wfile.write(
+                RAW_HEADER.pack(RAW_MAGIC, W, H, seq, len(data), flags, t_detected)
+            )
+            handler.wfile.write(data)
+            return RAW_HEADER.size + len(data)
+
+        self._stream(handler, self.raw, "raw", write_frame)
+
+    def _serve_snapshot(self, handler):
+        # The cached JPEG may be long stale when no stream client keeps the
+        # encoder busy, so make it run and wait for the next frame it encodes
+        with self.lock:
+            self.jpeg.clients += 1
+        try:
+            item = self.jpeg.wait_newer(self.jpeg.seq)
+        finally:
+            with self.lock:
+                self.jpeg.clients -= 1
+        if item is None or item[1] is None:
+            handler.send_error(503, "No frame available")
+            return
+        jpeg = item[1]
+        handler.send_response(200)
+        handler.send_header("Content-Type", "image/jpeg")
+        handler.send_header("Content-Length", str(len(jpeg)))
+        handler.end_headers()
+        handler.wfile.write(jpeg)
+
+    def serve(self):
+        self.httpd.serve_forever(poll_interval=0.5)
+
+    def shutdown(self):
+        self.stopping.set()
+        for latest in (self.raw, self.jpeg):
+            with latest.cond:
+                latest.cond.notify_all()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def server_process(
+    pool_name, stats_name, sub, stop, host=SERVER_HOST, port=SERVER_PORT
+):
+    """Bus subscriber publishing frames over HTTP"""
+    ignore_sigint()
+    pool = FramePool.attach(pool_name)
+    stats = PipelineStats.attach(stats_name)
+    server = FrameServer(host, port, stats)
+    encoders = ProcessPoolExecutor(
+        ENCODER_WORKERS, initializer=_encoder_init, initargs=(pool_name,)
+    )
+    # Start the encoders now, spawning them on the first frame delays it by
+    # over a second
+    for future in [encoders.submit(_encoder_ready) for _ in range(ENCODER_WORKERS)]:
+        future.result()
+    in_flight = threading.Semaphore(ENCODER_WORKERS)
+    http_thread = threading.Thread(target=server.serve, daemon=True)
+    http_thread.start()
+    print(f"Serving frames on http://{server.address[0]}:{server.address[1]}/mjpeg")
+
+    def encoded(future, slot, seq, t_detected):
+        sub.release(slot)
+        in_flight.release()
+        try:
+            server.jpeg.put(seq, future.result(), t_detected)
+            stats.add("server_frames_encoded")
+        except Exception:
+            stats.add("server_errors")
+
+    try:
+        while not stop.is_set():
+            try:
+                slot = sub.get(timeout=0.5)
+            except Empty:
+                continue
+
+            meta = pool.meta[slot]
+            seq, flags = int(meta["seq"]), int(meta["flags"])
+            t_detected = float(meta["t_detected"])
+            if server.wants_raw():
+                # One copy shared by every raw client
+                server.raw.put(seq, (flags, pool.frame(slot).tobytes()), t_detected)
+
+            # The slot stays held until its encoder is done with it
+            if server.wants_jpeg() and in_flight.acquire(blocking=False):
+                try:
+                    future = encoders.submit(_encode_jpeg, slot, JPEG_QUALITY)
+                    future.add_done_callback(
+                        lambda f, s=slot, q=seq, t=t_detected: encoded(f, s, q, t)
+                    )
+                    continue
+                except Exception:
+                    in_flight.release()
+                    stats.add("server_errors")
+            sub.release(slot)
+    finally:
+        server.shutdown()
+        encoders.shutdown(wait=True, cancel_futures=True)
+        sub.close()
+        pool.close()
+        stats.close()
+
+
+def read_raw_frames(url, n_frames, timeout=10.0):
+    """
+    Localhost test client for /raw: read n_frames, return their headers and
+    the client-side fps and detector-to-client latencies in milliseconds.
+    """
+    from urllib.request import urlopen
+
+    headers = []
+    latencies = []
+    t0 = time.perf_counter()
+    with urlopen(url, timeout=timeout) as resp:
+        for _ in range(n_frames):
+            head = RAW_HEADER.unpack(resp.read(RAW_HEADER.size))
+            if head[0] != RAW_MAGIC:
+                raise ValueError("Lost raw frame sync")
+            resp.read(head[4])
+            latencies.append((time.perf_counter() - head[6]) * 1e3)
+            headers.append(head)
+    dt = time.perf_counter() - t0
+    return headers, len(headers) / dt, np.array(latencies)
+
+
+if __name__ == "__main__":
+    import multiprocessing as mp
+    import smooth_stream
+
+    mp.set_start_method("spawn", force=True)
+    smooth_stream.main(
+        source=sys.argv[1] if len(sys.argv) > 1 else smooth_stream.SOURCE,
+        headless=True,
+        serve=True,
+    )
@@ -0,0 +1,375 @@
+"""
+Raw byte stream sources for the host-side streaming pipeline.
+A source delivers the FPGA byte stream (RGB565 frames followed by 512 bytes of
+0xA0A0 markers) as contiguous chunks, either from the live USB device or by
+replaying a dump written by packets_analyzer.post_process(), optionally
+through a model of the USB link.
+"""
+
+import os
+import time
+
+import numpy as np
+import usb1
+
+from usb_devices import DeviceSelector, find_device
+
+DUMP_PATH = "CV_acceleration/src/usb_2_0/usb_stream_dump/usb_stream_dump.bin"
+MARKER_BYTES = 512  # top.v sends 256 words of 0xA0A0 on vsync fall
+
+
+class FrameSource:
+    """Base class for a contiguous raw byte stream delivered in chunks"""
+
+    def open(self):
+        """Acquire the underlying resource, return False if it is unavailable"""
+        return True
+
+    def read(self):
+        """Return the next chunk, None if nothing arrived in time, raise EOFError when exhausted"""
+        raise NotImplementedError
+
+    def close(self):
+        """Release the underlying resource"""
+
+
+class UsbTransferRing(FrameSource):
+    """
+    Single device handle keeping a ring of asynchronous bulk IN transfers in flight.
+
+    libusb completes transfers queued on one endpoint in submission order, so
+    waiting on the ring slots round-robin yields a contiguous byte stream.
+    The view returned by read() stays valid until the next read(), which is
+    when its transfer is resubmitted.
+
+    Args:
+        vid, pid, ep_in: Device and bulk IN endpoint to stream from
+        transfer_size: Buffer size of each transfer in bytes
+        depth: Number of transfers kept in flight
+        timeout_ms: Per-transfer timeout, counted from submission
+        selector: DeviceSelector or selector string picking one of several
+            boards, None for the first one found
+    """
+
+    def __init__(
+        self, vid, pid, ep_in, transfer_size, depth, timeout_ms, selector=None
+    ):
+        if isinstance(selector, str):
+            selector = DeviceSelector.parse(selector)
+        self.selector = selector
+        self.vid = vid
+        self.pid = pid
+        self.ep_in = ep_in
+        self.transfer_size = transfer_size
+        self.depth = depth
+        self.timeout_ms = timeout_ms
+        self.context = None
+        self.handle = None
+        self.buffers = []
+        self.transfers = []
+        self.next = 0  # Ring slot whose data is delivered next
+        self.held = None  # Ring slot handed out by the last read()
+
+    def open(self):
+        self.context = usb1.USBContext()
+        try:
+            self.context.open()
+            if self.selector is None:
+                self.handle = self.context.openByVendorIDAndProductID(
+                    self.vid, self.pid, skip_on_error=True
+                )
+            else:
+                device = find_device(self.context, self.selector, self.vid, self.pid)
+                self.handle = device.open() if device is not None else None
+            if self.handle is None:
+                print(
+                    f"No board with VID=0x{self.vid:04X} PID=0x{self.pid:04X} "
+                    f"matching '{self.selector or 'any'}' found"
+                )
+                self.context.close()
+                return False
+
+            try:
+                self.handle.setAutoDetachKernelDriver(True)
+            except usb1.USBError:
+                pass
+            # A freshly plugged board is unconfigured; setting the configuration
+            # it already has would reset the device, so only set it when needed
+            if self.handle.getConfiguration() != 1:
+                self.handle.setConfiguration(1)
+            self.handle.claimInterface(0)
+        except (usb1.USBError, OSError, ValueError) as e:
+            # Busy, no permission, no libusb, or a selector matching several boards
+            print(f"Cannot open the USB device: {e}")
+            if self.handle is not None:
+                self.handle.close()
+                self.handle = None
+            self.context.close()
+            return False
+
+        self.buffers = [bytearray(self.transfer_size) for _ in range(self.depth)]
+        for buf in self.buffers:
+            transfer = self.handle.getTransfer()
+            transfer.setBulk(self.ep_in, buf, timeout=self.timeout_ms)
+            transfer.submit()
+            self.transfers.append(transfer)
+        self.next = 0
+        self.held = None
+        return True
+
+    def read(self):
+        # The caller is done with the previous buffer, put it back in flight
+        if self.held is not None:
+            self.transfers[self.held].submit()
+            self.held = None
+
+        transfer = self.transfers[self.next]
+        if transfer.isSubmitted():
+            self.context.handleEventsTimeout(self.timeout_ms / 1000)
+            if transfer.isSubmitted():
+                return None
+
+        status = transfer.getStatus()
+        if status == usb1.TRANSFER_NO_DEVICE:
+            raise EOFError
+
+        slot = self.next
+        self.next = (self.next + 1) % self.depth
+        self.held = slot
+
+        # A timed out transfer may still carry the bytes received before expiry
+        length = transfer.getActualLength()
+        if status == usb1.TRANSFER_COMPLETED or (
+            status == usb1.TRANSFER_TIMED_OUT and length
+        ):
+            return memoryview(self.buffers[slot])[:length]
+        if status == usb1.TRANSFER_TIMED_OUT:
+            return None
+        raise IOError(f"Bulk transfer failed with status {status}")
+
+    def close(self):
+        if self.handle is None:
+            return
+
+        for transfer in self.transfers:
+            if transfer.isSubmitted():
+                try:
+                    transfer.cancel()
+                except usb1.USBError:
+                    pass
+        while any(t.isSubmitted() for t in self.transfers):
+            self.context.handleEventsTimeout(0.1)
+
+        self.transfers = []
+        try:
+            self.handle.releaseInterface(0)
+        except usb1.USBError:
+            pass
+        self.handle.close()
+        self.context.close()
+        self.handle = None
+
+
+class FileReplaySource(FrameSource):
+    """
+    Replay a raw stream dump in fixed-size chunks.
+
+    Args:
+        path: Dump file, e.g. the one written by packets_analyzer.post_process()
+        chunk_size: Bytes returned by each read()
+        fps: Frame rate to pace the replay at, None for as-fast-as-possible
+        frame_bytes: Bytes per frame on the wire (pixels + marker), used for pacing
+        loop: Restart from the beginning of the file when it is exhausted
+    """
+
+    def __init__(self, path, chunk_size, fps=None, frame_bytes=None, loop=True):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.loop = loop
+        self.bytes_per_s = fps * frame_bytes if fps and frame_bytes else None
+        self.f = None
+        self.sent = 0
+        self.t0 = 0.0
+
+    def open(self):
+        if not os.path.isfile(self.path) or os.path.getsize(self.path) == 0:
+            print(f"Replay file '{self.path}' not found or empty")
+            return False
+        self.f = open(self.path, "rb")
+        self.sent = 0
+        self.t0 = time.perf_counter()
+        return True
+
+    def read(self):
+        data = self.f.read(self.chunk_size)
+        if not data:
+            if not self.loop:
+                raise EOFError
+            self.f.seek(0)
+            data = self.f.read(self.chunk_size)
+
+        # Pace to the wire rate: chunk N may leave only once the previous
+        # bytes would have been transmitted at bytes_per_s
+        if self.bytes_per_s:
+            deadline = self.t0 + self.sent / self.bytes_per_s
+            delay = deadline - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+        self.sent += len(data)
+        return data
+
+    def close(self):
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+
+
+class SimulatedUsbSource(FrameSource):
+    """
+    Replay a stream dump through a model of the bulk IN link, for tuning the
+    UsbTransferRing parameters without a board.
+
+    The device produces bytes at the wire rate into a FIFO of fifo_bytes.
+    The host controller moves them into the oldest transfer in flight; a
+    transfer completes when full, or when its timeout, counted from
+    submission, runs out. A transfer is back in flight once the caller asks
+    for the next chunk, as with UsbTransferRing. Bytes arriving while the
+    FIFO is full are lost, which tears the frame they belong to.
+
+    Args:
+        path: Dump file to replay, looped
+        transfer_size, depth, timeout_ms: As for UsbTransferRing
+        bytes_per_s: Wire rate of the device
+        fifo_bytes: Device side FIFO
+    """
+
+    def __init__(
+        self, path, transfer_size, depth, timeout_ms, bytes_per_s, fifo_bytes=32768
+    ):
+        self.path = path
+        self.transfer_size = transfer_size
+        self.depth = depth
+        self.timeout = timeout_ms / 1000
+        self.bytes_per_s = bytes_per_s
+        self.fifo_bytes = fifo_bytes
+        self.stream = None
+        self.lost = 0  # Bytes the device FIFO dropped
+        self.lost_ranges = []  # [start, end) stream positions of the dropped bytes
+
+    def open(self):
+        if not os.path.isfile(self.path) or os.path.getsize(self.path) == 0:
+            print(f"Replay file '{self.path}' not found or empty")
+            return False
+        self.stream = np.fromfile(self.path, dtype=np.uint8)
+        self.buffers = [bytearray(self.transfer_size) for _ in range(self.depth)]
+        self.fill = [0] * self.depth
+        self.deadline = [0.0] * self.depth
+        self.done = [False] * self.depth
+        self.fifo = []  # [stream position, length] segments waiting in the FIFO
+        self.fifo_len = 0
+        self.produced = 0  # Stream position of the next byte the device makes
+        self.t_last = time.perf_counter()
+        self.carry = 0.0  # Fraction of a byte produced so far
+        for slot in range(self.depth):
+            self._submit(slot, self.t_last)
+        self.next = 0
+        self.held = None
+        self.lost = 0
+        self.lost_ranges = []
+        return True
+
+    def _submit(self, slot, now):
+        self.fill[slot] = 0
+        self.deadline[slot] = now + self.timeout
+        self.done[slot] = False
+
+    def _copy(self, slot, pos, n):
+        """Copy n stream bytes starting at pos into a transfer, looping the dump"""
+        buf, size = self.buffers[slot], self.stream.size
+        while n:
+            start = pos % size
+            k = min(n, size - start)
+            at = self.fill[slot]
+            buf[at : at + k] = self.stream[start : start + k].data
+            self.fill[slot] += k
+            pos += k
+            n -= k
+
+    def _place(self, pos, n):
+        """Move bytes into the transfers in flight, return how many fit"""
+        placed = 0
+        for i in range(self.depth):
+            slot = (self.next + i) % self.depth
+            if self.done[slot] or slot == self.held:
+                continue
+            k = min(n - placed, self.transfer_size - self.fill[slot])
+            if k:
+                self._copy(slot, pos + placed, k)
+                placed += k
+            if self.fill[slot] == self.transfer_size:
+                self.done[slot] = True
+            if placed == n:
+                break
+        return placed
+
+    def _advance(self, now):
+        """Run the link model up to now"""
+        for slot in range(self.depth):
+            if not self.done[slot] and slot != self.held and now >= self.deadline[slot]:
+                self.done[slot] = True
+
+        # The FIFO drains first, then new bytes go to transfers or the FIFO
+        while self.fifo:
+            pos, n = self.fifo[0]
+            k = self._place(pos, n)
+            self.fifo_len -= k
+            if k < n:
+                self.fifo[0] = [pos + k, n - k]
+                break
+            self.fifo.pop(0)
+
+        self.carry += (now - self.t_last) * self.bytes_per_s
+        self.t_last = now
+        n = int(self.carry)
+        self.carry -= n
+        pos = self.produced
+        self.produced += n
+        k = self._place(pos, n) if not self.fifo else 0
+        room = min(n - k, self.fifo_bytes - self.fifo_len)
+        if room:
+            self.fifo.append([pos + k, room])
+            self.fifo_len += room
+        lost = n - k - room
+        if lost:
+            start = pos + k + room
+            if self.lost_ranges and self.lost_ranges[-1][1] == start:
+                self.lost_ranges[-1][1] += lost
+            else:
+                self.lost_ranges.append([start, start + lost])
+            self.lost += lost
+
+    def read(self):
+        now = time.perf_counter()
+        if self.held is not None:
+            self._submit(self.held, now)
+            self.held = None
+
+        slot = self.next
+        self._advance(now)
+        if not self.done[slot]:
+            # Sleep until the transfer fills up or times out
+            remaining = (self.transfer_size - self.fill[slot]) / self.bytes_per_s
+            wake = min(now + remaining, self.deadline[slot])
+            time.sleep(max(0.0, wake - now))
+            self._advance(max(time.perf_counter(), wake))
+            if not self.done[slot]:
+                return None
+
+        self.next = (slot + 1) % self.depth
+        self.held = slot
+        length = self.fill[slot]
+        return memoryview(self.buffers[slot])[:length] if length else None
+
+    def close(self):
+        self.stream = None
@@ -0,0 +1,197 @@
+"""
+asyncio API over the streaming pipeline, for services that embed the camera:
+
+    async with FrameStream() as stream:
+        async for frame in stream:
+            run_inference(frame.data)
+
+The reader thread and detector process run as in smooth_stream; frames are
+handed over as zero-copy views of their shared FramePool slot. One bridge
+thread blocks on the detector's queue and wakes the event loop per frame, so
+nothing polls with timeouts.
+"""
+
+import asyncio
+import threading
+from queue import Full
+
+import numpy as np
+
+from frame_decode import decode_frame_bgr
+from smooth_stream import (
+    BYTE_ORDER,
+    FRAME_SLOTS,
+    H,
+    PIXEL_FORMAT,
+    PIXEL_ORDER,
+    SOURCE,
+    W,
+    FramePipeline,
+)
+
+_STOP = -1  # Queue sentinel waking the bridge thread at shutdown
+BRIDGE_TIMEOUT = 2.0  # Seconds aclose() waits for the bridge thread
+
+
+class Frame:
+    """
+    One detected frame, backed by a shared FramePool slot.
+
+    data is a zero-copy view of the slot and stays valid until release();
+    the stream releases a frame when the next one is requested, so call
+    copy() on anything kept longer.
+    """
+
+    def __init__(self, pool, slot):
+        self._pool = pool
+        self.slot = slot
+        meta = pool.meta[slot]
+        self.seq = int(meta["seq"])
+        self.flags = int(meta["flags"])
+        self.length = int(meta["length"])
+        self.t_arrival = float(meta["t_arrival"])
+        self.t_detected = float(meta["t_detected"])
+        self.data = pool.frame(slot)
+
+    def decode(self, out=None):
+        """BGR image of the frame, into out if given"""
+        if out is None:
+            out = np.empty((H, W, 3), dtype=np.uint8)
+        return decode_frame_bgr(self.data, out, PIXEL_FORMAT, PIXEL_ORDER, BYTE_ORDER)
+
+    def copy(self):
+        """The pixel bytes as an array independent of the slot"""
+        return self.data.copy()
+
+    def release(self):
+        if self._pool is not None:
+            self.data = None
+            self._pool.release(self.slot)
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class FrameStream:
+    """
+    Async iterator of Frames from the streaming pipeline.
+
+    Args:
+        source: SOURCE kind, "usb" or "file"
+        maxsize: Frames buffered for a slow consumer, at most FRAME_SLOTS - 2
+        latest_only: Hand out only the newest frame, dropping any the consumer
+            has not taken yet instead of holding back the detector; the
+            buffer is then always one frame
+        report_stats: Print the periodic stats line
+    """
+
+    def __init__(self, source=SOURCE, maxsize=2, latest_only=False, report_stats=False):
+        # One slot stays with the consumer, one with the detector
+        self.maxsize = 1 if latest_only else max(1, min(maxsize, FRAME_SLOTS - 2))
+        self.latest_only = latest_only
+        # Free places in the queue, the bridge waits on it for room
+        self._room = threading.Semaphore(self.maxsize)
+        self.pipeline = FramePipeline(source, report_stats)
+        self.dropped = 0  # Frames discarded by latest_only
+        self._queue = None
+        self._bridge = None
+        self._current = None
+        self._closed = False
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        # Spawning the detector process blocks, keep it off the event loop
+        await loop.run_in_executor(None, self.pipeline.start)
+        self._bridge = threading.Thread(target=self._forward, daemon=True)
+        self._bridge.start()
+        return self
+
+    def _forward(self):
+        """Bridge thread: detector queue -> event loop, blocking on both sides"""
+        frame_queue, stop = self.pipeline.frame_queue, self.pipeline.stop
+        while True:
+            slot = frame_queue.get()
+            if slot == _STOP or stop.is_set():
+                if slot != _STOP:
+                    self.pipeline.pool.release(slot)
+                break
+            if not self.latest_only:
+                # Waits for room, which holds back the detector; aclose()
+                # releases it too so the wait always ends
+                self._room.acquire()
+                if self._closed:
+                    self.pipeline.pool.release(slot)
+                    break
+            try:
+                self._loop.call_soon_threadsafe(self._offer, slot)
+            except RuntimeError:  # Event loop already closed
+                self.pipeline.pool.release(slot)
+                break
+
+    def _offer(self, slot):
+        if self._closed:
+            self.pipeline.pool.release(slot)
+            return
+        if self._queue.full():  # Only with latest_only, otherwise there is room
+            self.pipeline.pool.release(self._queue.get_nowait())
+            self.dropped += 1
+        self._queue.put_nowait(slot)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._current is not None:
+            self._current.release()
+            self._current = None
+        if self._closed:
+            raise StopAsyncIteration
+        slot = await self._queue.get()
+        if not self.latest_only:
+            self._room.release()
+        if slot == _STOP:
+            raise StopAsyncIteration
+        self._current = Frame(self.pipeline.pool, slot)
+        return self._current
+
+    async def aclose(self):
+        """Stop the pipeline and free every slot, safe to call more than once"""
+        if self._closed:
+            return
+        self._closed = True
+        self._room.release()  # Wake a bridge waiting for room
+        if self._current is not None:
+            self._current.release()
+            self._current = None
+
+        if self._queue is not None:
+            # Free the buffered slots and wake a pending __anext__
+            while not self._queue.empty():
+                slot = self._queue.get_nowait()
+                if slot != _STOP:
+                    self.pipeline.pool.release(slot)
+            self._queue.put_nowait(_STOP)
+
+        if self._bridge is not None:
+            self.pipeline.stop.set()
+            if self._bridge.is_alive():
+                # A full queue means the bridge is not waiting on it and will
+                # see stop with the next frame it takes
+                try:
+                    self.pipeline.frame_queue.put_nowait(_STOP)
+                except Full:
+                    pass
+            await self._loop.run_in_executor(None, self._bridge.join, BRIDGE_TIMEOUT)
+        await asyncio.get_running_loop().run_in_executor(None, self.pipeline.close)
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
@@ -0,0 +1,89 @@
+"""
+Streaming frame marker scanner for the FPGA byte stream.
+The FPGA closes every frame with 512 bytes of 0xA0 (top.v); a run of at least
+MARKER_MIN_SIZE such bytes marks a frame boundary.
+"""
+
+import numpy as np
+
+MARKER_VALUE = 0xA0
+MARKER_MIN_SIZE = 255  # Minimum consecutive 0xA0 bytes to detect frame marker
+
+
+class MarkerScanner:
+    """
+    Incremental marker scanner carrying the current 0xA0 run across chunks.
+
+    Each byte fed is examined exactly once; scratch buffers are preallocated
+    and only grow if a larger chunk than `max_chunk` is fed. feed() returns
+    the absolute stream positions just past every marker run that ended in
+    the chunk, i.e. where the next frame's pixels start. A run still open at
+    the end of a chunk is reported by the feed() that terminates it.
+
+    Args:
+        min_size: Minimum run length counted as a marker
+        max_chunk: Expected largest chunk, sizes the scratch buffers
+    """
+
+    def __init__(self, min_size=MARKER_MIN_SIZE, max_chunk=1024 * 1024):
+        self.min_size = min_size
+        self.mask = np.empty(max_chunk + 1, dtype=bool)
+        self.edges = np.empty(max_chunk, dtype=bool)
+        self.pos = 0  # Absolute stream position of the next byte
+        self.run = 0  # Length of the 0xA0 run ending at pos
+
+    def reset(self, pos):
+        """Forget the carried run and continue scanning from absolute position pos"""
+        self.pos = pos
+        self.run = 0
+
+    def feed(self, chunk):
+        """Scan the next chunk of the stream, return the marker end positions in it"""
+        data = np.frombuffer(chunk, dtype=np.uint8)
+        n = data.size
+        if n == 0:
+            return _NO_MARKERS
+        if n > self.edges.size:
+            self.mask = np.empty(n + 1, dtype=bool)
+            self.edges = np.empty(n, dtype=bool)
+
+        # mask[0] is the state of the byte before the chunk, edges[i] flags
+        # every byte whose state differs from its predecessor
+        mask = self.mask[: n + 1]
+        edges = self.edges[:n]
+        mask[0] = self.run > 0
+        np.equal(data, MARKER_VALUE, out=mask[1:])
+        np.not_equal(mask[1:], mask[:-1], out=edges)
+        flips = np.flatnonzero(edges)
+
+        base = self.pos
+        self.pos += n
+
+        if flips.size == 0:
+            if self.run:
+                self.run += n
+            return _NO_MARKERS
+
+        # Flips alternate between run starts and run ends; an open run carried
+        # in from the previous chunk ends at the first flip
+        carried = -1
+        if self.run:
+            if self.run + int(flips[0]) >= self.min_size:
+                carried = base + int(flips[0])
+            starts = flips[1::2]
+            ends = flips[2::2]
+        else:
+            starts = flips[0::2]
+            ends = flips[1::2]
+
+        # A run still open at the end of the chunk is carried over
+        self.run = n - int(starts[-1]) if starts.size > ends.size else 0
+
+        lengths = ends - starts[: ends.size]
+        found = ends[lengths >= self.min_size] + base
+        if carried >= 0:
+            found = np.concatenate(([carried], found))
+        return found
+
+
+_NO_MARKERS = np.empty(0, dtype=np.int64)
@@ -0,0 +1,132 @@
+"""
+Several FPGA boards streaming from one host, one independent pipeline each.
+
+Every board runs the smooth_stream pipeline (reader, detector, display or
+recorder) in its own process, pinned to its own CPU cores; the detector and
+consumer processes it spawns inherit the pinning. The boards only share the
+parent, which owns their stats blocks and prints them per board and in total.
+
+    python multi_camera.py                      every board found
+    python multi_camera.py serial=A1 port=1-2   the listed boards
+"""
+
+import os
+import sys
+import time
+import multiprocessing as mp
+from multiprocessing import Process
+
+import smooth_stream
+from pipeline_stats import (
+    PipelineStats,
+    combine_snapshots,
+    format_stats_line,
+    write_prometheus,
+)
+from usb_devices import DeviceSelector, list_devices
+
+BOARDS = None  # Board selectors, None for every board found
+CORES_PER_BOARD = None  # None splits the available cores evenly
+HEADLESS = True  # Record every board instead of opening a window per board
+RECORD = False  # Also record while displaying
+STATS_INTERVAL = smooth_stream.STATS_INTERVAL
+STATS_FILE = "multi_camera_stats.prom"  # Per-board Prometheus file, None to disable
+
+
+def assign_cores(n_boards, cores_per_board=CORES_PER_BOARD):
+    """
+    Disjoint core sets per board, or shared round-robin ones when there are
+    fewer cores than boards. None entries mean no pinning (not Linux).
+    """
+    if not hasattr(os, "sched_getaffinity"):
+        return [None] * n_boards
+    cores = sorted(os.sched_getaffinity(0))
+    per_board = cores_per_board or max(1, len(cores) // n_boards)
+    return [
+        {cores[(i * per_board + j) % len(cores)] for j in range(per_board)}
+        for i in range(n_boards)
+    ]
+
+
+def board_process(selector, label, cores, stats_name, source, headless, record):
+    """One board's full pipeline, pinned to cores"""
+    if cores is not None:
+        os.sched_setaffinity(0, cores)
+    smooth_stream.main(
+        source=source,
+        headless=headless,
+        record=record,
+        device=selector,
+        label=label,
+        stats_name=stats_name,
+    )
+
+
+def report(boards, stats, procs):
+    """Print each board's stats line and the totals until every board exits"""
+    prev = [s.snapshot() for s in stats]
+    t_prev = time.perf_counter()
+    while any(p.is_alive() for p in procs):
+        time.sleep(STATS_INTERVAL)
+        cur = [s.snapshot() for s in stats]
+        now = time.perf_counter()
+        dt = now - t_prev
+        for label, c, p in zip(boards, cur, prev):
+            print(f"[{label}] {format_stats_line(c, p, dt)}")
+        if len(boards) > 1:
+            total = format_stats_line(combine_snapshots(cur), combine_snapshots(prev), dt)
+            print(f"[all] {total}", flush=True)
+        if STATS_FILE:
+            write_prometheus(STATS_FILE, None, dict(zip(boards, cur)))
+        prev, t_prev = cur, now
+
+
+def main(selectors=BOARDS, source="usb", headless=HEADLESS, record=RECORD):
+    """
+    Args:
+        selectors: Board selector strings, None for every board found
+        source: "usb", or "file" to replay REPLAY_FILE once per selector
+            for trying the setup without boards
+        headless, record: As for smooth_stream.main, per board
+    """
+    if selectors is None:
+        selectors = [f"port={board.port}" for board in list_devices()]
+    if not selectors:
+        print("No boards found")
+        return
+    labels = [DeviceSelector.parse(s).label for s in selectors]
+    if len(set(labels)) != len(labels):
+        raise ValueError(f"Duplicate boards in {selectors}")
+
+    cores = assign_cores(len(selectors))
+    stats = [PipelineStats.create() for _ in selectors]
+    procs = [
+        Process(
+            target=board_process,
+            args=(sel, label, cpus, s.name, source, headless, record),
+            name=f"board-{label}",
+        )
+        for sel, label, cpus, s in zip(selectors, labels, cores, stats)
+    ]
+    for label, cpus in zip(labels, cores):
+        pinned = ",".join(map(str, sorted(cpus))) if cpus is not None else "any"
+        print(f"Board {label}: cores {pinned}")
+    for proc in procs:
+        proc.start()
+
+    try:
+        report(labels, stats, procs)
+    except KeyboardInterrupt:
+        pass  # The boards got the same Ctrl+C and shut down on their own
+    finally:
+        for proc in procs:
+            proc.join(timeout=10)
+            if proc.is_alive():
+                proc.terminate()
+        for s in stats:
+            s.close()
+
+
+if __name__ == "__main__":
+    mp.set_start_method("spawn", force=True)
+    main(sys.argv[1:] or BOARDS)
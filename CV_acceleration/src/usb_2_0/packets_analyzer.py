@@ -1,7 +1,15 @@
+import array
+import json
+from errno import ENODEV, errorcode as errno_names
+import os
+import threading
 import time
+from queue import Empty, Queue
 import usb.core, usb.util, usb.backend.libusb1
 import numpy as np
 
+from usb_devices import DeviceSelector, port_path
+
 VID = 0x33AA
 PID = 0x0000
 EP_IN = 0x81
@@ -10,16 +18,107 @@ BULK_READ_SIZE = PKT_SIZE * 1024  # 512 KB per read
 READ_COUNT = 20
 TIMEOUT_MS = 20
 MAX_TIMEOUTS = 200  # Stop after these many consecutive timeouts
+MAX_ERRORS = 10  # Stop after these many consecutive USB errors
 FRAME_ONES_THRESHOLD = 511  # configurable threshold (consecutive occurrences)
 CONSECUTIVE_TARGET_VALUE = 255  # int8 arbitrary number to search for (0-255)
+CLASSIFY_CHUNK_PACKETS = 64 * 1024  # Packets classified per vectorised pass (32 MB)
+DUMP_FILE = "CV_acceleration/src/usb_2_0/usb_stream_dump/usb_stream_dump.bin"
+DEVICE = None  # Board selector such as "serial=..." or "port=1-2", see usb_devices
+
+# Marker report, written next to the analysed dump as <dump>.markers.<format>
+REPORT_FORMATS = ("json", "csv", "npy")
+VERBOSE_FRAMES = False  # Print every marker group and distance
+
+# Streaming capture, the first limit reached ends it (None disables a limit)
+CAPTURE_TO_DISK = False  # Stream to DUMP_FILE instead of collecting in RAM
+CAPTURE_SECONDS = 60.0
+CAPTURE_BYTES = None
+CAPTURE_BUFFERS = 64  # Preallocated BULK_READ_SIZE buffers shared with the writer
+
+# Per-transfer timing trace, saved next to the dump as <dump>.trace.npy
+TRACE_CAPACITY = 256 * 1024  # Transfers recorded, later ones are counted only
+TRACE_BIN_S = 0.5  # Throughput timeline resolution
+STALL_THRESHOLD_MS = 50.0  # No data for this long counts as a stall
+STALL_REPORT = 10  # Longest stalls listed
+STALL_MARKER_WINDOW = 64 * 1024  # Stalls this close to a marker count as blanking
+
+TRACE_OK, TRACE_TIMEOUT, TRACE_ERROR = 0, 1, 2
+TRACE_DTYPE = np.dtype(
+    [
+        ("t_start", "<f8"),  # perf_counter() before the read
+        ("t_end", "<f8"),  # perf_counter() after the read returned
+        ("offset", "<u8"),  # Stream offset of the first byte returned
+        ("nbytes", "<u4"),  # Bytes returned, 0 for timeouts and errors
+        ("status", "<i4"),  # TRACE_OK / TRACE_TIMEOUT / TRACE_ERROR
+        ("errno", "<i4"),  # errno of a TRACE_ERROR read, -1 if unknown, else 0
+    ]
+)
+
+
+class TransferTrace:
+    """Preallocated per-transfer timing log, filled by the capture loops."""
+
+    def __init__(self, capacity=TRACE_CAPACITY):
+        self.buf = np.zeros(capacity, dtype=TRACE_DTYPE)
+        self.count = 0
+        self.dropped = 0
+        self.offset = 0
+
+    def record(self, t_start, t_end, nbytes, status=TRACE_OK, errno=0):
+        if self.count < self.buf.size:
+            rec = self.buf[self.count]
+            rec["t_start"] = t_start
+            rec["t_end"] = t_end
+            rec["offset"] = self.offset
+            rec["nbytes"] = nbytes
+            rec["status"] = status
+            rec["errno"] = errno
+            self.count += 1
+        else:
+            self.dropped += 1
+        self.offset += nbytes
 
+    @property
+    def records(self):
+        return self.buf[: self.count]
 
-def read_usb_data():
-    """Continuously read from the USB device, return all data collected."""
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.save(path, self.records)
+
+
+def _device_serial(dev):
+    if not dev.iSerialNumber:
+        return None
+    try:
+        return usb.util.get_string(dev, dev.iSerialNumber)
+    except (usb.core.USBError, ValueError):
+        return None
+
+
+def open_device(selector=DEVICE):
+    """Find and configure the device picked by selector, return (dev, ep)."""
     backend = usb.backend.libusb1.get_backend()
-    dev = usb.core.find(idVendor=VID, idProduct=PID, backend=backend)
-    if dev is None:
-        raise ValueError("USB device not found")
+    devs = list(
+        usb.core.find(find_all=True, idVendor=VID, idProduct=PID, backend=backend)
+    )
+    if selector is not None:
+        selector = DeviceSelector.parse(selector)
+        devs = [
+            d
+            for d in devs
+            if selector.matches(
+                d.bus, d.port_numbers or (), lambda d=d: _device_serial(d)
+            )
+        ]
+    if not devs:
+        raise ValueError(f"USB device not found ({selector or 'any'})")
+    if len(devs) > 1:
+        ports = ", ".join(port_path(d.bus, d.port_numbers or ()) for d in devs)
+        if selector is not None:
+            raise ValueError(f"Selector '{selector}' matches several boards: {ports}")
+        print(f"Several boards found ({ports}), using the first; set DEVICE to choose")
+    dev = devs[0]
 
     dev.set_configuration()
     cfg = dev.get_active_configuration()
@@ -28,39 +127,80 @@ def read_usb_data():
     if ep is None:
         raise ValueError(f"Endpoint 0x{EP_IN:02X} not found")
 
-    print(f"Found device VID=0x{VID:04X}, PID=0x{PID:04X}, EP=0x{EP_IN:02X}")
+    print(
+        f"Found device VID=0x{VID:04X}, PID=0x{PID:04X}, EP=0x{EP_IN:02X} "
+        f"at port {port_path(dev.bus, dev.port_numbers or ())}"
+    )
+    return dev, ep
+
+
+def print_read_summary(total_bytes, elapsed):
+    mb_per_s = total_bytes / (elapsed * 1024 * 1024) if elapsed > 0 else 0.0
+    mbits_per_s = mb_per_s * 8
+
+    print("\n===== USB READ COMPLETE =====")
+    print(f"Total bytes read : {total_bytes:,}")
+    print(f"Elapsed time     : {elapsed:.3f} s")
+    print(f"Speed            : {mb_per_s:.2f} MB/s ({mbits_per_s:.2f} Mb/s)")
+    print("=================================\n")
+
+
+def _read_failed(e, t_read, trace, error_streak):
+    """
+    Record a failed read, return True if the capture should stop: the device
+    is gone or MAX_ERRORS reads in a row failed.
+    """
+    errno = e.errno if e.errno is not None else -1
+    if trace is not None:
+        trace.record(t_read, time.perf_counter(), 0, TRACE_ERROR, errno)
+    if errno == ENODEV:
+        print(f"\nStopped: device disconnected ({e}).")
+        return True
+    if error_streak >= MAX_ERRORS:
+        print(f"\nStopped: {error_streak} consecutive USB errors, last: {e}")
+        return True
+    return False
+
+
+def read_usb_data(trace: TransferTrace = None):
+    """Continuously read from the USB device, return all data collected."""
+    dev, ep = open_device()
     print(f"Bulk size: {BULK_READ_SIZE // 1024} KB | reads: {READ_COUNT}")
 
     all_data = []  # List to accumulate chunks
     total_bytes = 0
-    timeout_streak = 0
+    timeout_streak = error_streak = 0
     start = time.time()
 
     for i in range(READ_COUNT):
+        t_read = time.perf_counter()
         try:
             data = dev.read(ep.bEndpointAddress, BULK_READ_SIZE, timeout=TIMEOUT_MS)
+            if trace is not None:
+                trace.record(t_read, time.perf_counter(), len(data))
             all_data.append(data)
             total_bytes += len(data)
-            timeout_streak = 0
+            timeout_streak = error_streak = 0
         except usb.core.USBTimeoutError:
+            if trace is not None:
+                trace.record(t_read, time.perf_counter(), 0, TRACE_TIMEOUT)
             timeout_streak += 1
             if timeout_streak >= MAX_TIMEOUTS:
                 print(f"\nStopped: {timeout_streak} consecutive timeouts.")
                 break
             continue
+        except usb.core.USBError as e:
+            error_streak += 1
+            if _read_failed(e, t_read, trace, error_streak):
+                break
+            continue
         except KeyboardInterrupt:
             print("\nInterrupted by user.")
             break
 
-    elapsed = time.time() - start
-    mb_per_s = total_bytes / (elapsed * 1024 * 1024)
-    mbits_per_s = mb_per_s * 8
-
-    print("\n===== USB READ COMPLETE =====")
-    print(f"Total bytes read : {total_bytes:,}")
-    print(f"Elapsed time     : {elapsed:.3f} s")
-    print(f"Speed            : {mb_per_s:.2f} MB/s ({mbits_per_s:.2f} Mb/s)")
-    print("=================================\n")
+    print_read_summary(total_bytes, time.time() - start)
+    if trace is not None and trace.dropped:
+        print(f"Transfer trace full, {trace.dropped:,} reads not recorded")
 
     if not all_data:
         return np.array([], dtype=np.uint8)
@@ -68,6 +208,145 @@ def read_usb_data():
     return np.concatenate([np.frombuffer(chunk, dtype=np.uint8) for chunk in all_data])
 
 
+def _disk_writer(f, filled, free, result):
+    """Write filled buffers to f in order and hand them back to the reader."""
+    written = 0
+    while True:
+        item = filled.get()
+        if item is None:
+            break
+        buf, n = item
+        # After a write error keep recycling buffers, the reader stops on its own
+        if "error" not in result:
+            try:
+                view = memoryview(buf)[:n]
+                done = 0
+                while done < n:
+                    done += f.write(view[done:])
+                written += n
+            except OSError as e:
+                result["error"] = e
+        free.put(buf)
+    result["written"] = written
+
+
+def capture_to_disk(
+    path=DUMP_FILE,
+    max_seconds=CAPTURE_SECONDS,
+    max_bytes=CAPTURE_BYTES,
+    max_reads=None,
+    trace: TransferTrace = None,
+):
+    """
+    Read from the USB device straight to disk, return the number of bytes written.
+
+    Reads land in a fixed pool of preallocated buffers; a writer thread
+    streams filled buffers to path and recycles them while reading goes on,
+    so memory use does not grow with the capture. Stops at the first limit
+    reached, after MAX_TIMEOUTS consecutive timeouts, a write error, or on
+    Ctrl+C.
+    """
+    dev, ep = open_device()
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        f = open(path, "wb", buffering=0)
+    except OSError as e:
+        print(f"Cannot write capture to '{path}': {e}")
+        return 0
+    limits = [
+        f"{max_seconds:g} s" if max_seconds is not None else None,
+        f"{max_bytes:,} bytes" if max_bytes is not None else None,
+        f"{max_reads} reads" if max_reads is not None else None,
+    ]
+    print(f"Bulk size: {BULK_READ_SIZE // 1024} KB | buffers: {CAPTURE_BUFFERS}")
+    print(
+        f"Capturing to '{path}' until {', '.join(l for l in limits if l) or 'Ctrl+C'}"
+    )
+
+    # pyusb only reads in place into an array.array, other buffers are taken
+    # as a length
+    free = Queue()
+    for _ in range(CAPTURE_BUFFERS):
+        free.put(array.array("B", bytes(BULK_READ_SIZE)))
+    filled = Queue()
+    result = {}
+    writer = threading.Thread(
+        target=_disk_writer, args=(f, filled, free, result), daemon=True
+    )
+    writer.start()
+
+    total_bytes = 0
+    reads = 0
+    buffer_waits = 0  # Reads delayed because the writer fell behind
+    timeout_streak = error_streak = 0
+    start = time.time()
+
+    try:
+        while True:
+            if max_reads is not None and reads >= max_reads:
+                break
+            if max_bytes is not None and total_bytes >= max_bytes:
+                break
+            if max_seconds is not None and time.time() - start >= max_seconds:
+                break
+
+            if "error" in result or not writer.is_alive():
+                print("\nStopped: writing the capture failed.")
+                break
+            if free.empty():
+                buffer_waits += 1
+            try:
+                buf = free.get(timeout=1.0)
+            except Empty:
+                continue  # Writer still busy, or dead, checked above
+            t_read = time.perf_counter()
+            try:
+                n = dev.read(ep.bEndpointAddress, buf, timeout=TIMEOUT_MS)
+            except usb.core.USBTimeoutError:
+                if trace is not None:
+                    trace.record(t_read, time.perf_counter(), 0, TRACE_TIMEOUT)
+                free.put(buf)
+                timeout_streak += 1
+                if timeout_streak >= MAX_TIMEOUTS:
+                    print(f"\nStopped: {timeout_streak} consecutive timeouts.")
+                    break
+                continue
+            except usb.core.USBError as e:
+                free.put(buf)
+                error_streak += 1
+                if _read_failed(e, t_read, trace, error_streak):
+                    break
+                continue
+
+            timeout_streak = error_streak = 0
+            reads += 1
+            if max_bytes is not None:
+                n = min(n, max_bytes - total_bytes)
+            if trace is not None:
+                trace.record(t_read, time.perf_counter(), n)
+            filled.put((buf, n))
+            total_bytes += n
+    except KeyboardInterrupt:
+        print("\nInterrupted by user.")
+    finally:
+        elapsed = time.time() - start
+        filled.put(None)
+        writer.join()
+        f.close()
+
+    if trace is not None:
+        trace.save(path + ".trace.npy")
+    print_read_summary(total_bytes, elapsed)
+    print(f"Written to disk  : {result.get('written', 0):,} bytes")
+    if trace is not None and trace.dropped:
+        print(f"Transfer trace full, {trace.dropped:,} reads not recorded")
+    if "error" in result:
+        print(f"Write error: {result['error']}")
+    if buffer_waits:
+        print(f"Writer fell behind {buffer_waits} times, reads waited for a buffer")
+    return result.get("written", 0)
+
+
 def find_consecutive_value(packet: np.ndarray, threshold: int) -> bool:
     """Return True if the packet has >= threshold consecutive occurrences of CONSECUTIVE_TARGET_VALUE."""
     if packet.size == 0:
@@ -85,12 +364,75 @@ def find_consecutive_value(packet: np.ndarray, threshold: int) -> bool:
     return np.any(run_lengths >= threshold)
 
 
-def calculate_frame_marker_distances(marker_packets: list) -> np.ndarray:
+def classify_packets(
+    data: np.ndarray, threshold: int, chunk_packets: int = CLASSIFY_CHUNK_PACKETS
+) -> np.ndarray:
+    """
+    Return the indices of all PKT_SIZE packets holding >= threshold consecutive
+    CONSECUTIVE_TARGET_VALUE bytes, same result as find_consecutive_value() per packet.
+
+    The stream is processed chunk_packets packets at a time as a
+    (packets, PKT_SIZE) view, so memory stays constant and data may be an
+    np.memmap of a file larger than RAM.
+    """
+    packet_count = len(data) // PKT_SIZE
+    if threshold <= 0:
+        return np.arange(packet_count, dtype=np.int64)
+    if threshold > PKT_SIZE:
+        return np.array([], dtype=np.int64)
+
+    matches = []
+    for first in range(0, packet_count, chunk_packets):
+        n = min(chunk_packets, packet_count - first)
+        pkts = np.asarray(
+            data[first * PKT_SIZE : (first + n) * PKT_SIZE], dtype=np.uint8
+        ).reshape(n, PKT_SIZE)
+        mask = pkts == CONSECUTIVE_TARGET_VALUE
+
+        # A packet with fewer target bytes than threshold cannot hold the run,
+        # this rejects almost every packet before the windowed check
+        candidates = np.flatnonzero(np.count_nonzero(mask, axis=1) >= threshold)
+        if candidates.size == 0:
+            continue
+
+        # Window sums over threshold bytes via a per-row running count; a full
+        # window is a run of at least threshold
+        csum = np.zeros((candidates.size, PKT_SIZE + 1), dtype=np.int16)
+        np.cumsum(mask[candidates], axis=1, out=csum[:, 1:])
+        full = (csum[:, threshold:] - csum[:, :-threshold]) == threshold
+        matches.append(candidates[full.any(axis=1)] + first)
+
+    if not matches:
+        return np.array([], dtype=np.int64)
+    return np.concatenate(matches)
+
+
+def group_marker_packets(marker_packets) -> tuple:
+    """
+    Group consecutive marker packet indices into frame marker sequences.
+
+    Returns:
+        (first, last) packet index arrays, one entry per group
+    """
+    packets = np.asarray(marker_packets, dtype=np.int64)
+    if packets.size == 0:
+        return packets, packets
+    # A new group starts wherever the index is not one past its predecessor
+    breaks = np.flatnonzero(np.diff(packets) != 1) + 1
+    first = packets[np.concatenate(([0], breaks))]
+    last = packets[np.concatenate((breaks - 1, [packets.size - 1]))]
+    return first, last
+
+
+def calculate_frame_marker_distances(
+    marker_packets: list, verbose: bool = VERBOSE_FRAMES
+) -> np.ndarray:
     """
     Calculate the array of distances between frame marker boundaries.
 
     Args:
         marker_packets: List of packet indices that contain frame markers
+        verbose: Print one line per marker group and every distance
 
     Returns:
         numpy array of distances between the last packet of one frame marker
@@ -99,54 +441,19 @@ def calculate_frame_marker_distances(marker_packets: list) -> np.ndarray:
     if len(marker_packets) < 2:
         return np.array([], dtype=np.int32)
 
-    distances = []
-
-    # Identify frame marker groups (consecutive packets are part of the same marker sequence)
-    marker_groups = []
-    current_group = [marker_packets[0]]
-
-    for i in range(1, len(marker_packets)):
-        if marker_packets[i] == marker_packets[i - 1] + 1:
-            # Consecutive packet, part of same marker sequence
-            current_group.append(marker_packets[i])
-        else:
-            # Gap found, start new marker sequence
-            marker_groups.append(current_group)
-            current_group = [marker_packets[i]]
-
-    # Don't forget the last group
-    if current_group:
-        marker_groups.append(current_group)
+    first, last = group_marker_packets(marker_packets)
+    distances_array = (first[1:] - last[:-1]).astype(np.int32)
 
     print(f"\nFrame marker analysis:")
     print(f"Total marker packets: {len(marker_packets)}")
-    print(f"Number of frame marker groups: {len(marker_groups)}")
-
-    # Calculate distances between frame marker boundaries
-    for i in range(len(marker_groups) - 1):
-        last_packet_current_frame = marker_groups[i][
-            -1
-        ]  # Last packet of current marker sequence
-        first_packet_next_frame = marker_groups[i + 1][
-            0
-        ]  # First packet of next marker sequence
-        distance = first_packet_next_frame - last_packet_current_frame
-        distances.append(distance)
+    print(f"Number of frame marker groups: {first.size}")
 
-        print(
-            f"Frame {i+1}: markers {marker_groups[i][0]}-{marker_groups[i][-1]} "
-            f"({len(marker_groups[i])} packets), distance to next: {distance}"
-        )
-
-    # Show info about the last frame
-    if marker_groups:
-        last_frame_idx = len(marker_groups) - 1
-        print(
-            f"Frame {last_frame_idx+1}: markers {marker_groups[last_frame_idx][0]}-{marker_groups[last_frame_idx][-1]} "
-            f"({len(marker_groups[last_frame_idx])} packets)"
-        )
-
-    distances_array = np.array(distances, dtype=np.int32)
+    if verbose:
+        for i in range(first.size):
+            line = f"Frame {i+1}: markers {first[i]}-{last[i]} ({last[i] - first[i] + 1} packets)"
+            if i < distances_array.size:
+                line += f", distance to next: {distances_array[i]}"
+            print(line)
 
     if len(distances_array) > 0:
         print(f"\nFrame marker distance statistics:")
@@ -154,69 +461,345 @@ def calculate_frame_marker_distances(marker_packets: list) -> np.ndarray:
         print(f"Std deviation: {distances_array.std():.2f} packets")
         print(f"Min distance: {distances_array.min()} packets")
         print(f"Max distance: {distances_array.max()} packets")
-        print(f"All distances: {distances_array.tolist()}")
+        if verbose:
+            print(f"All distances: {distances_array.tolist()}")
 
     return distances_array
 
 
-def post_process(data: np.ndarray):
+def distance_summary(distances: np.ndarray) -> dict:
+    """Summary statistics of a distance array, JSON-serialisable"""
+    if distances.size == 0:
+        return {"count": 0}
+    p5, p50, p95 = np.percentile(distances, (5, 50, 95))
+    values, counts = np.unique(distances, return_counts=True)
+    top = np.argsort(counts)[::-1][:10]
+    return {
+        "count": int(distances.size),
+        "mean": float(distances.mean()),
+        "std": float(distances.std()),
+        "min": int(distances.min()),
+        "p5": float(p5),
+        "median": float(p50),
+        "p95": float(p95),
+        "max": int(distances.max()),
+        "most_common": [[int(values[k]), int(counts[k])] for k in top],
+    }
+
+
+def write_marker_report(
+    base_path: str, marker_packets, source: str = None, formats=REPORT_FORMATS
+) -> dict:
+    """
+    Write the marker groups and frame distances as a structured report.
+
+    Files written, by format:
+        json  <base>.json  Summary statistics and capture parameters
+        csv   <base>.csv   One row per marker group
+        npy   <base>.npy   The same rows as a structured array
+
+    Returns:
+        The summary dict
+    """
+    first, last = group_marker_packets(marker_packets)
+    groups = np.zeros(
+        first.size,
+        dtype=[
+            ("first_packet", "<i8"),
+            ("last_packet", "<i8"),
+            ("packets", "<i8"),
+            ("distance_to_next", "<i8"),  # -1 for the last group
+        ],
+    )
+    groups["first_packet"] = first
+    groups["last_packet"] = last
+    groups["packets"] = last - first + 1
+    groups["distance_to_next"] = -1
+    groups["distance_to_next"][:-1] = first[1:] - last[:-1]
+
+    summary = {
+        "source": source,
+        "packet_size": PKT_SIZE,
+        "target_value": CONSECUTIVE_TARGET_VALUE,
+        "threshold": FRAME_ONES_THRESHOLD,
+        "marker_packets": int(len(marker_packets)),
+        "marker_groups": int(first.size),
+        "distances": distance_summary(groups["distance_to_next"][:-1]),
+    }
+
+    folder = os.path.dirname(base_path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    if "json" in formats:
+        with open(base_path + ".json", "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+    if "csv" in formats:
+        np.savetxt(
+            base_path + ".csv",
+            groups.view(np.int64).reshape(-1, 4),
+            fmt="%d",
+            delimiter=",",
+            header=",".join(groups.dtype.names),
+            comments="",
+        )
+    if "npy" in formats:
+        np.save(base_path + ".npy", groups)
+    print(f"Marker report written to '{base_path}' ({', '.join(formats)})")
+    return summary
+
+
+def analyze_transfer_trace(trace: np.ndarray, marker_offsets: np.ndarray):
+    """
+    Report where the capture stalled and how stalls line up with frame markers.
+
+    A stall is a span longer than STALL_THRESHOLD_MS between two transfers
+    that returned data. It is split into host time (between one read
+    returning and the next being issued) and device time (inside reads,
+    including timeouts). Host time points at scheduling on this machine;
+    device time mid-frame points at FPGA fifo backpressure, while device time
+    at a marker is normal frame blanking.
+
+    Args:
+        trace: TRACE_DTYPE records in capture order
+        marker_offsets: Sorted stream offsets of the frame marker packets
+
+    Returns:
+        Structured array of the stalls found
+    """
+    if trace.size == 0:
+        print("\nEmpty transfer trace.")
+        return None
+
+    t0 = trace["t_start"][0]
+    durations_ms = (trace["t_end"] - trace["t_start"]) * 1e3
+    print(
+        f"\nTransfer trace: {trace.size:,} reads over {trace['t_end'][-1] - t0:.2f} s"
+    )
+    print(
+        f"Timeouts: {np.count_nonzero(trace['status'] == TRACE_TIMEOUT):,}, "
+        f"errors: {np.count_nonzero(trace['status'] == TRACE_ERROR):,}"
+    )
+    # Traces saved before errno was recorded lack the field
+    if "errno" in trace.dtype.names:
+        codes, counts = np.unique(
+            trace["errno"][trace["status"] == TRACE_ERROR], return_counts=True
+        )
+        for code, count in zip(codes.tolist(), counts.tolist()):
+            name = errno_names.get(code, "unknown") if code >= 0 else "unknown"
+            print(f"  errno {code} ({name}): {count:,}")
+
+    # ---- Throughput timeline, bytes credited to the bin the read ended in ----
+    bins = ((trace["t_end"] - t0) // TRACE_BIN_S).astype(np.int64)
+    timeline = np.bincount(bins, weights=trace["nbytes"]) / TRACE_BIN_S / 1024 / 1024
+    print(f"\nThroughput per {TRACE_BIN_S:g} s (MB/s):")
+    print(
+        f"Median {np.median(timeline):.2f}, min {timeline.min():.2f}, max {timeline.max():.2f}"
+    )
+    dips = np.flatnonzero(timeline < np.median(timeline) / 2)
+    for b in dips[:20]:
+        print(f"  dip at {b * TRACE_BIN_S:8.2f} s: {timeline[b]:.2f} MB/s")
+    if dips.size > 20:
+        print(f"  ... and {dips.size - 20} more dips")
+
+    # ---- Read duration histogram ----
+    edges = np.array([0, 0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, np.inf])
+    counts, _ = np.histogram(durations_ms, bins=edges)
+    print("\nRead durations:")
+    for lo, hi, c in zip(edges[:-1], edges[1:], counts):
+        if c:
+            print(f"  {lo:6g} - {hi:<6g} ms: {c:,}")
+
+    # ---- Stalls between consecutive data-returning reads ----
+    data_idx = np.flatnonzero(trace["nbytes"] > 0)
+    if data_idx.size < 2:
+        print("\nToo few data transfers for stall analysis.")
+        return None
+    host_gap = np.zeros(trace.size)
+    host_gap[1:] = np.maximum(trace["t_start"][1:] - trace["t_end"][:-1], 0)
+    host_cum = np.cumsum(host_gap)
+
+    prev, nxt = data_idx[:-1], data_idx[1:]
+    span_ms = (trace["t_end"][nxt] - trace["t_end"][prev]) * 1e3
+    is_stall = span_ms > STALL_THRESHOLD_MS
+    prev, nxt, span_ms = prev[is_stall], nxt[is_stall], span_ms[is_stall]
+
+    stalls = np.zeros(
+        prev.size,
+        dtype=[
+            ("time", "f8"),
+            ("duration_ms", "f8"),
+            ("host_ms", "f8"),
+            ("device_ms", "f8"),
+            ("offset", "u8"),
+            ("frame", "i8"),
+            ("frame_offset", "i8"),
+            ("marker_distance", "i8"),
+        ],
+    )
+    stalls["time"] = trace["t_end"][prev] - t0
+    stalls["duration_ms"] = span_ms
+    stalls["host_ms"] = (host_cum[nxt] - host_cum[prev]) * 1e3
+    stalls["device_ms"] = span_ms - stalls["host_ms"]
+    # Data stopped flowing right after the last byte of the previous read
+    stalls["offset"] = trace["offset"][nxt]
+
+    near = np.zeros(prev.size, dtype=bool)
+    if marker_offsets.size:
+        offsets = stalls["offset"].astype(np.int64)
+        idx = np.searchsorted(marker_offsets, offsets, side="right")
+        before = marker_offsets[np.maximum(idx - 1, 0)]
+        after = marker_offsets[np.minimum(idx, marker_offsets.size - 1)]
+        stalls["frame"] = idx
+        stalls["frame_offset"] = np.where(idx > 0, offsets - before, -1)
+        stalls["marker_distance"] = np.minimum(
+            np.abs(offsets - before), np.abs(after - offsets)
+        )
+        near = stalls["marker_distance"] <= STALL_MARKER_WINDOW
+    else:
+        stalls["frame"] = stalls["frame_offset"] = stalls["marker_distance"] = -1
+
+    total_ms = (trace["t_end"][-1] - t0) * 1e3
+    print(
+        f"\nStalls > {STALL_THRESHOLD_MS:g} ms: {stalls.size:,}, "
+        f"{stalls['duration_ms'].sum():.0f} ms of {total_ms:.0f} ms"
+    )
+    if stalls.size == 0:
+        return stalls
+    print(
+        f"Host-side time: {stalls['host_ms'].sum():.0f} ms, "
+        f"device-side time: {stalls['device_ms'].sum():.0f} ms"
+    )
+    if marker_offsets.size:
+        print(
+            f"Within {STALL_MARKER_WINDOW:,} B of a frame marker: {np.count_nonzero(near):,}, "
+            f"mid-frame: {np.count_nonzero(~near):,}"
+        )
+
+    print(f"\nLongest {min(STALL_REPORT, stalls.size)} stalls:")
+    for i in np.argsort(stalls["duration_ms"])[::-1][:STALL_REPORT]:
+        st = stalls[i]
+        cause = "host" if st["host_ms"] > st["device_ms"] else "device"
+        where = (
+            f"frame {st['frame']} +{st['frame_offset']:,} B, "
+            f"{st['marker_distance']:,} B from a marker"
+            if st["frame"] >= 0
+            else "no markers"
+        )
+        print(
+            f"  t={st['time']:8.3f} s {st['duration_ms']:8.1f} ms ({cause}: "
+            f"host {st['host_ms']:.1f} / device {st['device_ms']:.1f}) "
+            f"at byte {st['offset']:,}, {where}"
+        )
+    return stalls
+
+
+def stream_statistics(data: np.ndarray, chunk_bytes: int = 32 * 1024 * 1024):
+    """Byte histogram of the stream, computed chunk by chunk"""
+    hist = np.zeros(256, dtype=np.int64)
+    for start in range(0, len(data), chunk_bytes):
+        hist += np.bincount(
+            np.asarray(data[start : start + chunk_bytes], dtype=np.uint8),
+            minlength=256,
+        )
+    return hist
+
+
+def post_process(
+    data: np.ndarray,
+    save: bool = True,
+    trace: np.ndarray = None,
+    report_path: str = DUMP_FILE + ".markers",
+):
     """Do post‑processing and find packets with long consecutive 1s."""
     print("Starting post‑processing ...")
 
     # ---- Basic statistics ----
+    hist = stream_statistics(data)
+    values = np.arange(256)
+    mean = (hist * values).sum() / max(len(data), 1)
+    std = np.sqrt((hist * (values - mean) ** 2).sum() / max(len(data), 1))
+    present = np.flatnonzero(hist)
     print(f"Total samples: {len(data):,}")
-    print(f"Mean: {data.mean():.2f}, Std: {data.std():.2f}")
-    print(f"Min: {data.min()}   Max: {data.max()}")
+    print(f"Mean: {mean:.2f}, Std: {std:.2f}")
+    print(f"Min: {present.min()}   Max: {present.max()}")
 
     # ---- Count zeros/ones just for global info ----
-    ones = np.count_nonzero(data == 1)
-    zeros = np.count_nonzero(data == 0)
-    print(f"Zeros: {zeros:,}, Ones: {ones:,}")
+    print(f"Zeros: {hist[0]:,}, Ones: {hist[1]:,}")
 
     # ---- Frame boundary search ----
     print(
         f"\nSearching packets with >= {FRAME_ONES_THRESHOLD} consecutive '{CONSECUTIVE_TARGET_VALUE}'s ..."
     )
 
-    # Split the entire stream into 512‑byte logical packets
-    packet_count = len(data) // PKT_SIZE
-    matches = []
-
-    for pkt_idx in range(packet_count):
-        start = pkt_idx * PKT_SIZE
-        end = start + PKT_SIZE
-        pkt = data[start:end]
-        if find_consecutive_value(pkt, FRAME_ONES_THRESHOLD):
-            matches.append(pkt_idx)
+    # Classify the whole stream as 512‑byte logical packets
+    start = time.time()
+    matches = classify_packets(data, FRAME_ONES_THRESHOLD).tolist()
+    print(
+        f"Classified {len(data) // PKT_SIZE:,} packets in {time.time() - start:.2f} s"
+    )
 
     if matches:
-        print(f"\nFound {len(matches)} packets matching threshold:")
-        print(matches[:400])  # Show first 400 packet indices only
-        if len(matches) > 400:
-            print(f"... and {len(matches) - 400} more not shown")
+        print(f"\nFound {len(matches)} packets matching threshold")
+        if VERBOSE_FRAMES:
+            print(matches[:400])  # Show first 400 packet indices only
+            if len(matches) > 400:
+                print(f"... and {len(matches) - 400} more not shown")
 
         # Calculate frame marker distances
-        frame_distances = calculate_frame_marker_distances(matches)
-        print(f"Frame marker distances: {frame_distances}")
+        calculate_frame_marker_distances(matches)
+        if report_path:
+            write_marker_report(
+                report_path, matches, source=getattr(data, "filename", None)
+            )
 
     else:
         print("No packets found with that pattern.")
 
+    # ---- Transfer timing ----
+    if trace is not None:
+        analyze_transfer_trace(trace, np.array(matches, dtype=np.int64) * PKT_SIZE)
+
     # ---- Save binary dump for offline analysis ----
-    out_file = "CV_acceleration/src/usb_2_0/usb_stream_dump/usb_stream_dump.bin"
-    with open(out_file, "wb") as f:
-        data.tofile(f)
-    print(f"\nSaved raw stream to '{out_file}' ({len(data)/1024/1024:.1f} MB)")
+    if save:
+        out_file = DUMP_FILE
+        os.makedirs(os.path.dirname(out_file) or ".", exist_ok=True)
+        with open(out_file, "wb") as f:
+            data.tofile(f)
+        print(f"\nSaved raw stream to '{out_file}' ({len(data)/1024/1024:.1f} MB)")
+        if trace is not None:
+            np.save(out_file + ".trace.npy", trace)
 
     print("\nPost-processing complete.")
 
 
+def analyze_dump(path: str = DUMP_FILE):
+    """Re-run post-processing on a saved dump without loading it into RAM."""
+    trace_file = path + ".trace.npy"
+    trace = np.load(trace_file) if os.path.exists(trace_file) else None
+    post_process(
+        np.memmap(path, dtype=np.uint8, mode="r"),
+        save=False,
+        trace=trace,
+        report_path=path + ".markers",
+    )
+
+
 def main():
     try:
-        data_array = read_usb_data()
+        trace = TransferTrace()
+        if CAPTURE_TO_DISK:
+            if capture_to_disk(trace=trace) > 0:
+                analyze_dump(DUMP_FILE)
+            else:
+                print("No data collected, skipping post‑processing.")
+            return
+
+        data_array = read_usb_data(trace)
         if data_array.size > 0:
-            post_process(data_array)
+            post_process(data_array, trace=trace.records)
         else:
+            # Keep the trace, it records why nothing arrived
+            trace.save(DUMP_FILE + ".trace.npy")
             print("No data collected, skipping post‑processing.")
     except Exception as e:
         print(f"Error: {e}")
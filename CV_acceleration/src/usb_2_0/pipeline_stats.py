@@ -0,0 +1,233 @@
+"""
+Shared per-stage counters and gauges for the streaming pipeline.
+Every stage process attaches to the same shared-memory block and updates only
+its own fields, so no locking is needed; the main process publishes them.
+"""
+
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# name, kind, help
+STAT_FIELDS = (
+    ("reader_bytes", "counter", "Bytes read from the source"),
+    ("reader_transfers", "counter", "Non-empty transfers read from the source"),
+    ("reader_timeouts", "counter", "Reads that returned no data in time"),
+    ("reader_errors", "counter", "Reads that failed"),
+    (
+        "reader_frames_skipped",
+        "counter",
+        "Whole frames left out because the raw ring was full",
+    ),
+    ("ring_dropped_chunks", "counter", "Writes that tore a frame, raw ring full"),
+    ("ring_dropped_bytes", "counter", "Bytes of the writes that tore a frame"),
+    ("ring_fill_bytes", "gauge", "Bytes waiting in the raw ring"),
+    ("detector_frames_emitted", "counter", "Frames handed to the display"),
+    ("detector_frames_rejected", "counter", "Frames failing length or overflow checks"),
+    ("detector_frames_skipped", "counter", "Valid frames skipped, no free frame slot"),
+    (
+        "detector_frames_repaired",
+        "counter",
+        "Frames realigned after lost or extra bytes",
+    ),
+    ("detector_resyncs", "counter", "Times the detector lost sync"),
+    ("detector_lock_misses", "counter", "Predicted markers not found in the window"),
+    ("detector_errors", "counter", "Unexpected detector exceptions"),
+    ("frame_queue_depth", "gauge", "Frames waiting for the frame fan-out"),
+    ("bus_frames_dropped", "counter", "Frames subscribers missed by their drop policy"),
+    ("frame_slots_busy", "gauge", "Frame slots in use"),
+    ("processor_frames", "counter", "Frames processed and published in order"),
+    ("processor_seconds", "counter", "Worker time spent decoding and processing"),
+    (
+        "processor_frames_skipped",
+        "counter",
+        "Frames not processed, no free result slot",
+    ),
+    (
+        "processor_frames_late",
+        "counter",
+        "Frames finished after the reorder window passed them",
+    ),
+    ("processor_errors", "counter", "Frames a processor failed on"),
+    ("display_frames", "counter", "Frames decoded and shown"),
+    ("display_decode_seconds", "counter", "Time spent decoding frames"),
+    ("display_show_seconds", "counter", "Time spent in imshow and waitKey"),
+    ("display_errors", "counter", "Unexpected display exceptions"),
+    ("recorder_frames", "counter", "Frames written to the recording"),
+    ("recorder_bytes", "counter", "Frame bytes written to the recording"),
+    ("recorder_write_seconds", "counter", "Time spent writing frames"),
+    ("recorder_errors", "counter", "Unexpected recorder exceptions"),
+    ("server_frames_encoded", "counter", "Frames JPEG-encoded for network clients"),
+    ("server_clients", "gauge", "Network clients currently streaming"),
+    ("server_errors", "counter", "Unexpected frame server exceptions"),
+)
+STAT_INDEX = {name: i for i, (name, _, _) in enumerate(STAT_FIELDS)}
+
+PROM_PREFIX = "smooth_stream_"
+
+
+class PipelineStats:
+    """Float64 counters and gauges in shared memory, one slot per STAT_FIELDS entry"""
+
+    def __init__(self, shm, create=False):
+        self.shm = shm
+        self.owner = create
+        self.values = np.ndarray(len(STAT_FIELDS), dtype=np.float64, buffer=shm.buf)
+        if create:
+            self.values[:] = 0
+
+    @classmethod
+    def create(cls):
+        shm = shared_memory.SharedMemory(create=True, size=len(STAT_FIELDS) * 8)
+        return cls(shm, create=True)
+
+    @classmethod
+    def attach(cls, name):
+        """Open a stats block created by another process"""
+        return cls(shared_memory.SharedMemory(name=name))
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def add(self, field, amount=1):
+        self.values[STAT_INDEX[field]] += amount
+
+    def set(self, field, value):
+        self.values[STAT_INDEX[field]] = value
+
+    def snapshot(self):
+        """Consistent-enough copy of all fields, as a dict"""
+        values = self.values.tolist()
+        return {name: values[i] for i, (name, _, _) in enumerate(STAT_FIELDS)}
+
+    def close(self):
+        self.values = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def format_stats_line(cur, prev, dt):
+    """One-line human summary of the interval between two snapshots"""
+
+    def rate(field):
+        return (cur[field] - prev[field]) / dt if dt > 0 else 0.0
+
+    shown = cur["display_frames"] - prev["display_frames"]
+    decode_ms = (
+        (cur["display_decode_seconds"] - prev["display_decode_seconds"]) / shown * 1e3
+        if shown
+        else 0.0
+    )
+    show_ms = (
+        (cur["display_show_seconds"] - prev["display_show_seconds"]) / shown * 1e3
+        if shown
+        else 0.0
+    )
+
+    return (
+        f"USB {rate('reader_bytes') / 1024 / 1024:6.2f} MB/s "
+        f"{rate('reader_transfers'):5.0f} xfer/s "
+        f"to {cur['reader_timeouts']:.0f} err {cur['reader_errors']:.0f} | "
+        f"ring {cur['ring_fill_bytes'] / 1024 / 1024:5.1f} MB "
+        f"skip {cur['reader_frames_skipped']:.0f} torn {cur['ring_dropped_chunks']:.0f} | "
+        f"frames {rate('detector_frames_emitted'):5.1f}/s "
+        f"rej {cur['detector_frames_rejected']:.0f} "
+        f"skip {cur['detector_frames_skipped']:.0f} "
+        f"rep {cur['detector_frames_repaired']:.0f} "
+        f"resync {cur['detector_resyncs']:.0f} | "
+        f"queue {cur['frame_queue_depth']:.0f} slots {cur['frame_slots_busy']:.0f} | "
+        f"cv {rate('processor_frames'):5.1f}/s late {cur['processor_frames_late']:.0f} | "
+        f"display {rate('display_frames'):5.1f} fps "
+        f"decode {decode_ms:.2f} ms show {show_ms:.2f} ms | "
+        f"rec {rate('recorder_bytes') / 1024 / 1024:6.2f} MB/s | "
+        f"net {cur['server_clients']:.0f} clients "
+        f"jpeg {rate('server_frames_encoded'):5.1f}/s"
+    )
+
+
+def combine_snapshots(snapshots):
+    """Sum of several pipelines' snapshots, for the totals across boards"""
+    return {name: sum(snap[name] for snap in snapshots) for name, _, _ in STAT_FIELDS}
+
+
+def write_prometheus(path, cur, boards=None):
+    """
+    Write a snapshot in the Prometheus text exposition format, atomically.
+
+    Args:
+        path: Output file
+        cur: Snapshot
+        boards: Optional {label: snapshot} written instead of cur, one series
+            per board label; sum() across them in queries for the totals
+    """
+    lines = []
+    for name, kind, help_text in STAT_FIELDS:
+        metric = PROM_PREFIX + name + ("_total" if kind == "counter" else "")
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} {kind}")
+        if boards is None:
+            lines.append(f"{metric} {cur[name]:.17g}")
+            continue
+        for label, snap in boards.items():
+            lines.append(f'{metric}{{board="{label}"}} {snap[name]:.17g}')
+
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp, path)
+
+
+LATENCY_STAGES = (
+    ("usb_to_detect", "USB arrival -> frame emitted"),
+    ("queue_wait", "Frame emitted -> picked up by display"),
+    ("decode", "Decode"),
+    ("show", "imshow + waitKey"),
+    ("end_to_end", "USB arrival -> imshow returned"),
+)
+
+
+class LatencyTracker:
+    """Rolling window of per-stage latencies with percentile reports"""
+
+    def __init__(self, window=4096):
+        self.window = window
+        self.samples = {name: np.full(window, np.nan) for name, _ in LATENCY_STAGES}
+        self.count = 0
+
+    def record(self, t_arrival, t_detected, t_picked, t_decoded, t_shown):
+        """Add one frame's perf_counter() timestamps"""
+        i = self.count % self.window
+        self.samples["usb_to_detect"][i] = t_detected - t_arrival
+        self.samples["queue_wait"][i] = t_picked - t_detected
+        self.samples["decode"][i] = t_decoded - t_picked
+        self.samples["show"][i] = t_shown - t_decoded
+        self.samples["end_to_end"][i] = t_shown - t_arrival
+        self.count += 1
+
+    def percentiles(self):
+        """{stage: (p50, p95, p99, max)} in milliseconds over the window"""
+        result = {}
+        for name, _ in LATENCY_STAGES:
+            values = self.samples[name]
+            values = values[~np.isnan(values)]
+            if values.size == 0:
+                continue
+            p50, p95, p99 = np.percentile(values, (50, 95, 99)) * 1e3
+            result[name] = (p50, p95, p99, values.max() * 1e3)
+        return result
+
+    def format_report(self):
+        """Multi-line table of the current percentiles"""
+        lines = [
+            f"Frame latency over the last {min(self.count, self.window)} of {self.count} frames (ms):",
+            f"  {'stage':<40}{'p50':>8}{'p95':>8}{'p99':>8}{'max':>8}",
+        ]
+        table = self.percentiles()
+        for name, label in LATENCY_STAGES:
+            if name in table:
+                p50, p95, p99, top = table[name]
+                lines.append(f"  {label:<40}{p50:8.2f}{p95:8.2f}{p99:8.2f}{top:8.2f}")
+        return "\n".join(lines)
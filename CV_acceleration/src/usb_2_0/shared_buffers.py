@@ -0,0 +1,293 @@
+"""
+Shared-memory buffers connecting the streaming pipeline processes without
+pickling or copying the payload through multiprocessing queues.
+"""
+
+from multiprocessing import shared_memory
+
+import time
+
+import numpy as np
+
+# ByteRing header slots (uint64 each), followed by the overflow gap log and
+# the chunk arrival log (end positions, then perf_counter() times)
+_CAPACITY, _MIRROR, _HEAD, _TAIL, _DROPPED_CHUNKS, _DROPPED_BYTES, _GAP_SEQ = range(7)
+_CHUNK_SEQ = 7
+_GAP_LOG = 8
+_GAP_LOG_LEN = 64
+_CHUNK_LOG_LEN = 256
+_CHUNK_LOG = (_GAP_LOG + _GAP_LOG_LEN) * 8
+_HEADER_BYTES = _CHUNK_LOG + _CHUNK_LOG_LEN * 16
+_POOL_HEADER_BYTES = 64
+
+
+class ByteRing:
+    """
+    Single-producer single-consumer byte ring in shared memory.
+
+    head and tail are absolute stream positions (total bytes written and
+    released), so the consumer can keep working with monotonic offsets.
+    The first `mirror` bytes of the ring are duplicated past its end, which
+    makes any span of up to `mirror` bytes readable as one contiguous view,
+    even when it wraps around.
+
+    Writes that do not fit are dropped whole and counted. Each resulting gap
+    in the stream is logged with its position so the consumer can reject the
+    frame it tore instead of passing on a corrupted image. The arrival time
+    of recent chunks is logged too, for latency measurements.
+    """
+
+    def __init__(self, shm, create=False, capacity=0, mirror=0):
+        self.shm = shm
+        self.owner = create
+        self.hdr = np.ndarray(_GAP_LOG + _GAP_LOG_LEN, dtype=np.uint64, buffer=shm.buf)
+        self.chunk_ends = np.ndarray(
+            _CHUNK_LOG_LEN, dtype=np.uint64, buffer=shm.buf, offset=_CHUNK_LOG
+        )
+        self.chunk_times = np.ndarray(
+            _CHUNK_LOG_LEN,
+            dtype=np.float64,
+            buffer=shm.buf,
+            offset=_CHUNK_LOG + _CHUNK_LOG_LEN * 8,
+        )
+        if create:
+            self.hdr[:] = 0
+            self.hdr[_CAPACITY] = capacity
+            self.hdr[_MIRROR] = mirror
+            self.chunk_ends[:] = 0
+            self.chunk_times[:] = 0
+        self.capacity = int(self.hdr[_CAPACITY])
+        self.mirror = int(self.hdr[_MIRROR])
+        self.data = np.ndarray(
+            self.capacity + self.mirror,
+            dtype=np.uint8,
+            buffer=shm.buf,
+            offset=_HEADER_BYTES,
+        )
+        self.view_all = memoryview(self.data)
+        self.gaps_seen = 0  # Consumer side cursor into the gap log
+
+    @classmethod
+    def create(cls, capacity, mirror):
+        """Allocate a new ring, `mirror` is the longest contiguous span readable"""
+        if mirror > capacity:
+            raise ValueError("Ring mirror cannot exceed its capacity")
+        shm = shared_memory.SharedMemory(
+            create=True, size=_HEADER_BYTES + capacity + mirror
+        )
+        return cls(shm, create=True, capacity=capacity, mirror=mirror)
+
+    @classmethod
+    def attach(cls, name):
+        """Open a ring created by another process"""
+        return cls(shared_memory.SharedMemory(name=name))
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    # --- Producer side ---
+
+    def write(self, data, t_arrival=None):
+        """
+        Append data to the ring, return False (and count a drop) if it does not fit.
+
+        t_arrival is the perf_counter() time the chunk was received, now if None.
+        """
+        src = np.frombuffer(data, dtype=np.uint8)
+        n = src.size
+        head = int(self.hdr[_HEAD])
+        if n > self.capacity - (head - int(self.hdr[_TAIL])):
+            self.hdr[_DROPPED_CHUNKS] += 1
+            self.hdr[_DROPPED_BYTES] += n
+
+            # Back-to-back drops leave a single gap at the same position
+            seq = int(self.hdr[_GAP_SEQ])
+            last = _GAP_LOG + (seq - 1) % _GAP_LOG_LEN
+            if seq == 0 or int(self.hdr[last]) != head:
+                self.hdr[_GAP_LOG + seq % _GAP_LOG_LEN] = head
+                self.hdr[_GAP_SEQ] = seq + 1
+            return False
+
+        pos = head % self.capacity
+        first = min(n, self.capacity - pos)
+        self._put(pos, src[:first])
+        if first < n:
+            self._put(0, src[first:])
+
+        seq = int(self.hdr[_CHUNK_SEQ])
+        self.chunk_ends[seq % _CHUNK_LOG_LEN] = head + n
+        self.chunk_times[seq % _CHUNK_LOG_LEN] = (
+            time.perf_counter() if t_arrival is None else t_arrival
+        )
+        self.hdr[_CHUNK_SEQ] = seq + 1
+
+        # Publish only after the payload is in place
+        self.hdr[_HEAD] = head + n
+        return True
+
+    def _put(self, pos, src):
+        self.data[pos : pos + src.size] = src
+        if pos < self.mirror:
+            m = min(src.size, self.mirror - pos)
+            self.data[self.capacity + pos : self.capacity + pos + m] = src[:m]
+
+    # --- Consumer side ---
+
+    def head(self):
+        return int(self.hdr[_HEAD])
+
+    def view(self, pos, n):
+        """Contiguous memoryview of n bytes starting at absolute position pos"""
+        if n > self.mirror:
+            raise ValueError(f"Span of {n} bytes exceeds the ring mirror")
+        start = pos % self.capacity
+        return self.view_all[start : start + n]
+
+    def fill(self):
+        """Bytes written but not yet released"""
+        return int(self.hdr[_HEAD]) - int(self.hdr[_TAIL])
+
+    def release(self, pos):
+        """Hand every byte before absolute position pos back to the producer"""
+        if pos > int(self.hdr[_TAIL]):
+            self.hdr[_TAIL] = pos
+
+    def new_gaps(self):
+        """
+        Positions of the overflow gaps logged since the last call.
+
+        Bytes following a gap position were lost. Returns None if the log
+        wrapped before it was read, in which case any buffered frame may be torn.
+        """
+        seq = int(self.hdr[_GAP_SEQ])
+        if seq == self.gaps_seen:
+            return []
+        gaps = [
+            int(self.hdr[_GAP_LOG + i % _GAP_LOG_LEN])
+            for i in range(self.gaps_seen, seq)
+        ]
+        overran = int(self.hdr[_GAP_SEQ]) - self.gaps_seen > _GAP_LOG_LEN
+        self.gaps_seen = seq
+        return None if overran else gaps
+
+    def arrival_time(self, pos):
+        """perf_counter() time the byte at absolute position pos arrived, nan if too old"""
+        seq = int(self.hdr[_CHUNK_SEQ])
+        idx = np.arange(max(0, seq - _CHUNK_LOG_LEN), seq) % _CHUNK_LOG_LEN
+        k = int(np.searchsorted(self.chunk_ends[idx], pos, side="right"))
+        if k == 0 and seq > _CHUNK_LOG_LEN or k == idx.size:
+            return float("nan")
+        return float(self.chunk_times[idx[k]])
+
+    def dropped(self):
+        """(chunks, bytes) dropped on overflow so far"""
+        return int(self.hdr[_DROPPED_CHUNKS]), int(self.hdr[_DROPPED_BYTES])
+
+    def close(self):
+        self.view_all.release()
+        self.hdr = self.data = self.chunk_ends = self.chunk_times = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+# FramePool slot states and frame flags
+SLOT_FREE, SLOT_BUSY = 0, 1
+FRAME_PADDED = 1 << 0  # Frame arrived short and was padded
+FRAME_TRIMMED = 1 << 1  # Frame arrived long and was cut to size
+FRAME_REPAIRED = 1 << 2  # Bytes lost or duplicated, realigned at line granularity
+
+SLOT_META = np.dtype(
+    [
+        ("state", np.uint32),
+        ("flags", np.uint32),
+        ("seq", np.uint64),
+        ("length", np.uint64),
+        ("t_arrival", np.float64),  # perf_counter() when the marker bytes arrived
+        ("t_detected", np.float64),  # perf_counter() when the frame was emitted
+    ]
+)
+
+
+class FramePool:
+    """
+    Fixed pool of preallocated frame slots in shared memory.
+
+    The producer acquires a free slot, writes the frame into it once and
+    passes only the slot index downstream; the consumer releases the slot
+    when it is done with the pixels. Each slot carries a SLOT_META record.
+    A slot's state only moves FREE -> BUSY in the producer and BUSY -> FREE
+    in the consumer, so no lock is needed.
+    """
+
+    def __init__(self, shm, create=False, n_slots=0, slot_size=0):
+        self.shm = shm
+        self.owner = create
+        hdr = np.ndarray(2, dtype=np.uint64, buffer=shm.buf)
+        if create:
+            hdr[:] = (n_slots, slot_size)
+        self.n_slots = int(hdr[0])
+        self.slot_size = int(hdr[1])
+        self.meta = np.ndarray(
+            self.n_slots, dtype=SLOT_META, buffer=shm.buf, offset=_POOL_HEADER_BYTES
+        )
+        if create:
+            self.meta[:] = 0
+        self.slots = np.ndarray(
+            (self.n_slots, self.slot_size),
+            dtype=np.uint8,
+            buffer=shm.buf,
+            offset=self._data_offset(self.n_slots),
+        )
+        self.cursor = 0  # Producer side round-robin search start
+
+    @staticmethod
+    def _data_offset(n_slots):
+        meta_end = _POOL_HEADER_BYTES + n_slots * SLOT_META.itemsize
+        return (meta_end + 63) // 64 * 64
+
+    @classmethod
+    def create(cls, n_slots, slot_size):
+        """Allocate n_slots frames of slot_size bytes each"""
+        shm = shared_memory.SharedMemory(
+            create=True, size=cls._data_offset(n_slots) + n_slots * slot_size
+        )
+        return cls(shm, create=True, n_slots=n_slots, slot_size=slot_size)
+
+    @classmethod
+    def attach(cls, name):
+        """Open a pool created by another process"""
+        return cls(shared_memory.SharedMemory(name=name))
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def acquire(self):
+        """Producer: claim a free slot, return its index or -1 if all are in use"""
+        for i in range(self.n_slots):
+            slot = (self.cursor + i) % self.n_slots
+            if self.meta["state"][slot] == SLOT_FREE:
+                self.meta["state"][slot] = SLOT_BUSY
+                self.cursor = (slot + 1) % self.n_slots
+                return slot
+        return -1
+
+    def busy(self):
+        """Number of slots currently in use"""
+        return int(np.count_nonzero(self.meta["state"]))
+
+    def frame(self, slot):
+        """Writable uint8 view of a slot's pixels"""
+        return self.slots[slot]
+
+    def release(self, slot):
+        """Consumer: hand a slot back to the producer"""
+        self.meta["state"][slot] = SLOT_FREE
+
+    def close(self):
+        self.meta = self.slots = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
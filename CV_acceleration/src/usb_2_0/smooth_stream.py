@@ -1,16 +1,94 @@
-import usb.core, usb.util, usb.backend.libusb1
-import numpy as np, cv2, threading
+import numpy as np, cv2, signal, threading, time
 import multiprocessing as mp
 from multiprocessing import Process, Queue, Event
+from queue import Empty
+
+from frame_bus import FrameBus, POLICY_ALL, POLICY_LATEST
+from frame_decode import decode_frame_bgr
+from frame_recorder import FrameRecorder
+from frame_repair import (
+    REPAIR_MAX_LINES,
+    fit_to_markers,
+    marker_jitter,
+    marker_overrun,
+    repair_frame,
+)
+from frame_source import DUMP_PATH, MARKER_BYTES, UsbTransferRing, FileReplaySource
+from marker_scanner import MarkerScanner
+from pipeline_stats import (
+    LatencyTracker,
+    PipelineStats,
+    format_stats_line,
+    write_prometheus,
+)
+from shared_buffers import (
+    ByteRing,
+    FramePool,
+    FRAME_PADDED,
+    FRAME_REPAIRED,
+    FRAME_TRIMMED,
+)
+from stream_format import load_stream_format
+from usb_autotune import PROFILE_PATH, load_usb_profile
 
 # --- Config ---
 VID, PID, EP_IN = 0x33AA, 0x0000, 0x81
-W, H = 640, 480
-BULK_READ_SIZE = 32 * 1024 * 1024  # 32 MB per transfer
-FRAME_SIZE = W * H * 2  # 2 bytes per pixel for RGB565
-TIMEOUT_MS = 100
-NUM_READERS = 8  # Multiple reader threads
+BULK_READ_SIZE = 1024 * 1024  # 1 MB per transfer
+BYTE_ORDER = "little"  # Order of the two RGB565 bytes of a pixel on the wire
+TIMEOUT_MS = 1000  # Counted from submission, so it must cover the whole ring
+NUM_TRANSFERS = 16  # Asynchronous bulk transfers kept in flight
+USB_PROFILE = PROFILE_PATH  # Measured by usb_autotune, overrides the three above
+FRAME_SLOTS = 16  # Shared frame slots between detector and display
+FRAME_TOLERANCE = 0.02  # Accepted deviation of a frame's length on the wire
+
+_profile = load_usb_profile(USB_PROFILE)
+if _profile is not None:
+    BULK_READ_SIZE = _profile["transfer_size"]
+    NUM_TRANSFERS = _profile["num_transfers"]
+    TIMEOUT_MS = _profile["timeout_ms"]
+
+# --- Stream format, from the sensor registers the FPGA loads ---
+STREAM_FORMAT = load_stream_format()
+W, H = STREAM_FORMAT.width, STREAM_FORMAT.height
+PIXEL_FORMAT = STREAM_FORMAT.pixel_format  # RGB565, YUV422, RAW8 or Y8
+PIXEL_ORDER = STREAM_FORMAT.component_order  # YUV422 byte order / Bayer pattern
+FRAME_SIZE = STREAM_FORMAT.frame_size
+LINE_BYTES = W * STREAM_FORMAT.bytes_per_pixel
+
+# Buffers scale with the frame: the mirror must hold a whole frame with
+# margin, the ring several of them
+_MB = 1024 * 1024
+RING_MIRROR = max(4 * _MB, -(-2 * (FRAME_SIZE + MARKER_BYTES) // _MB) * _MB)
+RING_SIZE = max(64 * _MB, 16 * RING_MIRROR)
 MARKER_MIN_SIZE = 255  # Minimum consecutive 0xA0 bytes to detect frame marker
+LOCK_AFTER = 3  # Consecutive valid frames before predicting the next marker
+LOCK_WINDOW = 2048  # Bytes probed either side of the predicted marker end
+REPAIR_FRAMES = True  # Realign frames a few lines short or long, see frame_repair
+
+# --- Source selection ---
+SOURCE = "usb"  # "usb" for the live device, "file" to replay a stream dump
+DEVICE = None  # Board selector such as "serial=..." or "port=1-2", see usb_devices
+REPLAY_FILE = DUMP_PATH
+REPLAY_CHUNK_SIZE = 512 * 1024
+REPLAY_FPS = STREAM_FORMAT.fps  # None replays as fast as possible
+
+# --- Headless recording ---
+HEADLESS = False  # Record frames to disk instead of opening the display
+RECORD = False  # Also record while displaying
+RECORD_PATH = "CV_acceleration/src/usb_2_0/recordings/capture"  # No extension
+
+# --- Frame fan-out, every consumer subscribes with its own drop policy ---
+DISPLAY_POLICY = POLICY_LATEST  # The display only ever needs the newest frame
+RECORD_POLICY = POLICY_ALL  # The recorder takes every frame it can keep up with
+SUBSCRIBER_QUEUE = 8  # Frames queued per POLICY_ALL subscriber
+SERVE = False  # Publish frames over HTTP, see frame_server.py
+SERVER_POLICY = POLICY_LATEST  # Network clients skip frames, never the pipeline
+PROCESS_CHAIN = ()  # Processors run before display, e.g. ("edges",), see frame_processing
+PROCESS_QUEUE = 2  # Frames queued for the processing workers beyond those in flight
+
+# --- Stats ---
+STATS_INTERVAL = 1.0  # Seconds between stats reports
+STATS_FILE = "smooth_stream_stats.prom"  # Prometheus text file, None to disable
 
 
 def decode_rgb565_fast(frame_bytes):
@@ -43,191 +121,720 @@ def find_frame_marker_fast(buf_view, start, end, min_size=MARKER_MIN_SIZE):
     return -1
 
 
-def usb_reader(raw_queue, stop, reader_id):
-    """USB reader thread - reads raw data and puts into queue"""
-    dev = usb.core.find(
-        idVendor=VID, idProduct=PID, backend=usb.backend.libusb1.get_backend()
-    )
-    if not dev:
+class FrameGate:
+    """
+    Admits the byte stream into the ring a whole frame at a time.
+
+    Every chunk is scanned for frame boundaries. At each boundary the next
+    frame is let in only if the ring has room for all of it, otherwise its
+    bytes are dropped up to the following boundary. When the host falls
+    behind it loses whole frames and the ring keeps an unbroken stream,
+    instead of having a chunk torn out of the middle of a frame.
+
+    Args:
+        ring: ByteRing to write into, as its single producer
+        frame_bytes: Largest frame admitted, marker included
+        max_chunk: Expected largest chunk, sizes the scanner
+    """
+
+    def __init__(self, ring, frame_bytes, max_chunk):
+        self.ring = ring
+        self.frame_bytes = frame_bytes
+        self.scanner = MarkerScanner(MARKER_MIN_SIZE, max_chunk)
+        self.admit = True  # Whether the current frame's bytes go into the ring
+
+    def write(self, data, t_arrival):
+        """Pass one chunk on, return the number of frames skipped"""
+        base = self.scanner.pos
+        bounds = self.scanner.feed(data).tolist()
+        view = memoryview(data)
+        skipped = start = 0
+        for bound in bounds + [base + len(view)]:
+            end = bound - base
+            if self.admit and end > start:
+                if not self.ring.write(view[start:end], t_arrival):
+                    # Longer than admitted for, drop the rest of the frame
+                    self.admit = False
+            if end == len(view):
+                break
+            self.admit = self.ring.capacity - self.ring.fill() >= self.frame_bytes
+            skipped += not self.admit
+            start = end
+        return skipped
+
+
+def source_reader(source, ring, stats, stop):
+    """Reader thread - pulls raw chunks from a FrameSource into the shared byte ring"""
+    if not source.open():
+        stop.set()  # Nothing will arrive, end the session instead of waiting
         return
-
-    dev.set_configuration()
-
-    try:
-        dev.set_auto_detach_kernel_driver(True)
-    except:
-        pass
-
-    ep = usb.util.find_descriptor(
-        dev.get_active_configuration()[(0, 0)], bEndpointAddress=EP_IN
+    # Admit a frame only with room for its longest accepted length
+    gate = FrameGate(
+        ring,
+        int((FRAME_SIZE + MARKER_BYTES) * (1 + FRAME_TOLERANCE)),
+        max(BULK_READ_SIZE, REPLAY_CHUNK_SIZE),
     )
-    if not ep:
-        return
 
-    while not stop.is_set():
+    try:
+        while not stop.is_set():
+            try:
+                data = source.read()
+                t_arrival = time.perf_counter()
+                if data is None or len(data) == 0:
+                    stats.add("reader_timeouts")
+                    continue
+
+                stats.add("reader_transfers")
+                stats.add("reader_bytes", len(data))
+                skipped = gate.write(data, t_arrival)
+                if skipped:
+                    stats.add("reader_frames_skipped", skipped)
+            except EOFError:
+                break
+            except Exception:
+                stats.add("reader_errors")
+    finally:
+        source.close()
+
+
+def stats_reporter(stats, ring, pool, frame_queue, stop, publish=True):
+    """
+    Reporter thread - samples the gauges and publishes all stats periodically.
+    Without publish only the gauges are kept up to date, for a stats block
+    someone else reports.
+    """
+    prev = stats.snapshot()
+    t_prev = time.perf_counter()
+
+    while not stop.wait(STATS_INTERVAL):
+        stats.set("ring_fill_bytes", ring.fill())
+        chunks, nbytes = ring.dropped()
+        stats.set("ring_dropped_chunks", chunks)
+        stats.set("ring_dropped_bytes", nbytes)
+        stats.set("frame_slots_busy", pool.busy())
         try:
-            data = dev.read(ep.bEndpointAddress, BULK_READ_SIZE, timeout=TIMEOUT_MS)
-            if len(data) > 0 and not raw_queue.full():
-                raw_queue.put(bytes(data))
-        except usb.core.USBError as e:
-            if e.errno != 110:  # Ignore timeout errors
-                pass
-        except:
+            stats.set("frame_queue_depth", frame_queue.qsize())
+        except NotImplementedError:  # macOS
             pass
 
-
-def marker_detector_process(raw_queue, frame_queue, stop):
-    """Marker detection and frame extraction with validation"""
-    buf = bytearray(BULK_READ_SIZE * 8)
-    buf_view = memoryview(buf)
-    buf_len = 0
-
+        if not publish:
+            continue
+        cur = stats.snapshot()
+        now = time.perf_counter()
+        print(format_stats_line(cur, prev, now - t_prev), flush=True)
+        if STATS_FILE:
+            write_prometheus(STATS_FILE, cur)
+        prev, t_prev = cur, now
+
+
+def make_source(kind, device=DEVICE):
+    """Build the reader source for the selected SOURCE kind"""
+    if kind == "usb":
+        return UsbTransferRing(
+            VID, PID, EP_IN, BULK_READ_SIZE, NUM_TRANSFERS, TIMEOUT_MS, device
+        )
+    if kind == "file":
+        return FileReplaySource(
+            REPLAY_FILE,
+            REPLAY_CHUNK_SIZE,
+            fps=REPLAY_FPS,
+            frame_bytes=FRAME_SIZE + MARKER_BYTES,
+        )
+    raise ValueError(f"Unknown source '{kind}'")
+
+
+def ignore_sigint():
+    """
+    Called first in child processes: Ctrl+C reaches the whole process group,
+    the parent handles it by setting stop and the children wind down from there.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def marker_detector_process(ring_name, pool_name, stats_name, frame_queue, stop):
+    """Marker detection and frame extraction with validation, scanning the raw ring in place"""
+    ignore_sigint()
+    ring = ByteRing.attach(ring_name)
+    pool = FramePool.attach(pool_name)
+    stats = PipelineStats.attach(stats_name)
+    frame_seq = 0
+    scan_span = ring.mirror  # Longest span the ring can expose contiguously
+    scanner = MarkerScanner(MARKER_MIN_SIZE, max_chunk=scan_span)
+
+    # Absolute stream positions
     frame_start = 0
     synced = False
-    last_search_pos = 0
+    late_start = 0  # marker_overrun() of the marker opening the frame
+    scan_pos = 0
+    seen_head = 0
+    gaps = []  # Overflow gaps not yet behind frame_start
 
     # Frame validation thresholds
-    MIN_VALID_FRAME = int(FRAME_SIZE * 0.98)
-    MAX_VALID_FRAME = int(FRAME_SIZE * 1.02)
+    MIN_VALID_FRAME = int(FRAME_SIZE * (1 - FRAME_TOLERANCE))
+    MAX_VALID_FRAME = int(FRAME_SIZE * (1 + FRAME_TOLERANCE))
+    MAX_FRAME_SPAN = MAX_VALID_FRAME
+    if REPAIR_FRAMES:
+        MAX_FRAME_SPAN = max(
+            MAX_VALID_FRAME, FRAME_SIZE + MARKER_BYTES + REPAIR_MAX_LINES * LINE_BYTES
+        )
 
     # Auto re-sync parameters
     consecutive_bad_frames = 0
     MAX_BAD_FRAMES = 5
 
+    # Predictive lock state
+    consecutive_good_frames = 0
+    locked = False
+    lock_len = 0
+
     while not stop.is_set():
         try:
-            try:
-                data = raw_queue.get(timeout=0.1)
-            except:
+            head = ring.head()
+            if head == seen_head:
+                time.sleep(0.001)
                 continue
-
-            data_len = len(data)
-            buf[buf_len : buf_len + data_len] = data
-            buf_len += data_len
-
-            search_start = max(last_search_pos - MARKER_MIN_SIZE, frame_start)
-
-            while search_start < buf_len - MARKER_MIN_SIZE:
-                marker_pos = find_frame_marker_fast(buf_view, search_start, buf_len)
-
-                if marker_pos == -1:
-                    last_search_pos = buf_len
+            seen_head = head
+
+            # Gaps are read after head, so every gap before head is known
+            new_gaps = ring.new_gaps()
+            if new_gaps is None:
+                if synced:
+                    stats.add("detector_resyncs")
+                synced = locked = False
+                gaps = []
+            else:
+                gaps.extend(new_gaps)
+
+            # Locked: each marker should end one frame length after the
+            # previous one, probe only a small window around that position
+            markers = []
+            last = frame_start
+            while locked:
+                predicted = last + lock_len
+                lo = max(predicted - MARKER_BYTES - LOCK_WINDOW, last)
+                hi = predicted + LOCK_WINDOW + 1
+                if head < hi:
                     break
 
-                marker_abs_pos = search_start + marker_pos
-
+                scanner.reset(lo)
+                found = scanner.feed(ring.view(lo, hi - lo))
+                found = found[found >= predicted - LOCK_WINDOW]
+                if found.size:
+                    last = int(found[0])
+                    markers.append(last)
+                else:
+                    # Marker not where predicted, fall back to a full scan
+                    stats.add("detector_lock_misses")
+                    locked = False
+                scan_pos = last
+                scanner.reset(scan_pos)
+
+            # Full scan: every byte is fed to the scanner exactly once
+            if not locked:
+                while scan_pos < head:
+                    span = min(head - scan_pos, scan_span)
+                    markers.extend(scanner.feed(ring.view(scan_pos, span)).tolist())
+                    scan_pos += span
+
+            for marker_abs_pos in markers:
                 if not synced:
                     frame_start = marker_abs_pos
                     synced = True
-                    last_search_pos = marker_abs_pos
+                    late_start = 0
                     consecutive_bad_frames = 0
-                    search_start = marker_abs_pos
+                    consecutive_good_frames = 0
                 else:
                     frame_len = marker_abs_pos - frame_start
-
-                    # Frame validation
-                    if MIN_VALID_FRAME <= frame_len <= MAX_VALID_FRAME:
+                    frame_gaps = [g for g in gaps if frame_start <= g < marker_abs_pos]
+                    torn = bool(frame_gaps)
+
+                    # Bytes lost or duplicated: realign at line granularity
+                    # instead of padding a sheared image or dropping it.
+                    # Marker jitter only moves the frame, fitted further down
+                    lost = FRAME_SIZE + MARKER_BYTES - frame_len
+                    jitter = (
+                        REPAIR_FRAMES
+                        and 0 < abs(lost) < LINE_BYTES
+                        and not torn
+                        and marker_jitter(
+                            ring.view(frame_start, frame_len - MARKER_BYTES),
+                            FRAME_SIZE,
+                            late_start,
+                        )
+                    )
+                    repaired = False
+                    if (
+                        REPAIR_FRAMES
+                        and lost != 0
+                        and not jitter
+                        and len(frame_gaps) <= 1
+                        and abs(lost) <= REPAIR_MAX_LINES * LINE_BYTES
+                    ):
+                        slot = pool.acquire()
+                        if slot >= 0:
+                            split = frame_gaps[0] - frame_start if torn else None
+                            if (
+                                repair_frame(
+                                    ring.view(frame_start, frame_len - MARKER_BYTES),
+                                    pool.frame(slot),
+                                    LINE_BYTES,
+                                    split,
+                                )
+                                >= 0
+                            ):
+                                meta = pool.meta[slot]
+                                meta["flags"] = FRAME_REPAIRED
+                                meta["seq"] = frame_seq
+                                meta["length"] = frame_len
+                                meta["t_arrival"] = ring.arrival_time(
+                                    marker_abs_pos - 1
+                                )
+                                meta["t_detected"] = time.perf_counter()
+                                frame_seq += 1
+
+                                frame_queue.put(slot)
+                                stats.add("detector_frames_emitted")
+                                stats.add("detector_frames_repaired")
+                                consecutive_bad_frames = 0
+                                repaired = True
+                            else:
+                                pool.release(slot)
+
+                    # Frame validation, a frame torn by a ring overflow is never valid
+                    if repaired:
+                        pass
+                    elif MIN_VALID_FRAME <= frame_len <= MAX_VALID_FRAME and not torn:
                         consecutive_bad_frames = 0
-
-                        if not frame_queue.full():
-                            actual_frame_len = min(frame_len, FRAME_SIZE)
-                            frame_data = bytes(
-                                buf_view[frame_start : frame_start + actual_frame_len]
-                            )
-
-                            # Pad if short
-                            if len(frame_data) < FRAME_SIZE:
-                                frame_data += b"\x00" * (FRAME_SIZE - len(frame_data))
-                            # Trim if long
-                            elif len(frame_data) > FRAME_SIZE:
-                                frame_data = frame_data[:FRAME_SIZE]
-
-                            frame_queue.put(frame_data)
+                        consecutive_good_frames += 1
+
+                        # Enough regular frames in a row, predict the next one
+                        if consecutive_good_frames >= LOCK_AFTER:
+                            locked = True
+                            lock_len = frame_len
+
+                        slot = pool.acquire()
+                        if slot >= 0:
+                            frame = pool.frame(slot)
+                            flags = 0
+                            if jitter:
+                                # Cut or pad where the marker took or gave bytes
+                                padded = fit_to_markers(
+                                    ring.view(frame_start, frame_len - MARKER_BYTES),
+                                    frame,
+                                )
+                                flags |= FRAME_PADDED if padded > 0 else FRAME_TRIMMED
+                            else:
+                                actual_frame_len = min(frame_len, FRAME_SIZE)
+                                frame[:actual_frame_len] = np.frombuffer(
+                                    ring.view(frame_start, actual_frame_len),
+                                    dtype=np.uint8,
+                                )
+                                # Pad if short
+                                if actual_frame_len < FRAME_SIZE:
+                                    frame[actual_frame_len:] = 0
+                                    flags |= FRAME_PADDED
+                                # Anything beyond pixels and marker was cut off
+                                elif frame_len > FRAME_SIZE + MARKER_BYTES:
+                                    flags |= FRAME_TRIMMED
+
+                            meta = pool.meta[slot]
+                            meta["flags"] = flags
+                            meta["seq"] = frame_seq
+                            meta["length"] = frame_len
+                            meta["t_arrival"] = ring.arrival_time(marker_abs_pos - 1)
+                            meta["t_detected"] = time.perf_counter()
+                            frame_seq += 1
+
+                            frame_queue.put(slot)
+                            stats.add("detector_frames_emitted")
+                        else:
+                            stats.add("detector_frames_skipped")
                     else:
                         # Invalid frame - discard
+                        stats.add("detector_frames_rejected")
                         consecutive_bad_frames += 1
+                        consecutive_good_frames = 0
+                        locked = False
 
                         # Auto re-sync if too many bad frames
                         if consecutive_bad_frames >= MAX_BAD_FRAMES:
+                            stats.add("detector_resyncs")
                             synced = False
                             consecutive_bad_frames = 0
 
+                    # Measured while the marker is still in the ring
+                    late_start = 0
+                    if marker_abs_pos - MARKER_BYTES - LINE_BYTES >= frame_start:
+                        late_start = marker_overrun(
+                            ring.view(
+                                marker_abs_pos - MARKER_BYTES - LINE_BYTES, LINE_BYTES
+                            )
+                        )
                     frame_start = marker_abs_pos
-                    last_search_pos = marker_abs_pos
-                    search_start = marker_abs_pos
-
-            # Cleanup buffer
-            if frame_start > BULK_READ_SIZE * 2:
-                remaining = buf_len - frame_start
-                buf[:remaining] = buf[frame_start:buf_len]
-                buf_len = remaining
-                last_search_pos -= frame_start
-                frame_start = 0
-
-        except:
-            pass
 
-
-def display_process(frame_queue, stop):
-    """RGB565 decoding and OpenCV display"""
-    cv2.namedWindow("OV5640", cv2.WINDOW_NORMAL)
+            # A marker this far away can only close an invalid frame, drop sync
+            # rather than pinning the ring
+            if synced and not locked and scan_pos - frame_start > MAX_FRAME_SPAN:
+                stats.add("detector_resyncs")
+                synced = False
+                consecutive_bad_frames = 0
+
+            # Hand consumed bytes back to the reader
+            keep = frame_start if synced else scan_pos
+            if gaps:
+                gaps = [g for g in gaps if g >= keep]
+            ring.release(keep)
+
+        except Exception:
+            stats.add("detector_errors")
+
+    ring.close()
+    pool.close()
+    stats.close()
+
+
+def display_process(pool_name, stats_name, sub, stop, processed=False, title="OV5640"):
+    """
+    Frame decoding and OpenCV display.
+
+    With processed set, pool_name is the processing stage's result pool
+    holding gray or BGR images instead of raw frames.
+    """
+    ignore_sigint()
+    pool = FramePool.attach(pool_name)
+    stats = PipelineStats.attach(stats_name)
+    frame_bgr = np.empty((H, W, 3), dtype=np.uint8)
+    latency = LatencyTracker()
+    cv2.namedWindow(title, cv2.WINDOW_NORMAL)
 
     try:
         while not stop.is_set():
             try:
-                frame_data = frame_queue.get(timeout=0.5)
-                frame_rgb = decode_rgb565_fast(frame_data)
-                cv2.imshow("OV5640", frame_rgb[:, :, ::-1])
+                slot = sub.get(timeout=0.5)
+            except Empty:
+                continue
 
-                if cv2.waitKey(1) & 0xFF == 27:
+            try:
+                t0 = time.perf_counter()
+                meta = pool.meta[slot]
+                t_arrival, t_detected = float(meta["t_arrival"]), float(
+                    meta["t_detected"]
+                )
+                if processed:
+                    image = pool.frame(slot)[: int(meta["length"])]
+                    if image.size == W * H:
+                        cv2.cvtColor(image.reshape(H, W), cv2.COLOR_GRAY2BGR, frame_bgr)
+                    else:
+                        np.copyto(frame_bgr, image.reshape(H, W, 3))
+                else:
+                    decode_frame_bgr(
+                        pool.frame(slot),
+                        frame_bgr,
+                        PIXEL_FORMAT,
+                        PIXEL_ORDER,
+                        BYTE_ORDER,
+                    )
+                sub.release(slot)
+                t1 = time.perf_counter()
+                cv2.imshow(title, frame_bgr)
+                key = cv2.waitKey(1)
+                t2 = time.perf_counter()
+
+                stats.add("display_frames")
+                stats.add("display_decode_seconds", t1 - t0)
+                stats.add("display_show_seconds", t2 - t1)
+                latency.record(t_arrival, t_detected, t0, t1, t2)
+
+                if key & 0xFF == 27:
                     stop.set()
                     break
-            except:
-                if stop.is_set():
-                    break
-                continue
+            except Exception:
+                stats.add("display_errors")
     finally:
         cv2.destroyAllWindows()
+        print(latency.format_report())
+        sub.close()
+        pool.close()
+        stats.close()
+
+
+def recorder_process(pool_name, stats_name, sub, stop, path):
+    """Headless consumer writing every frame to an indexed raw container"""
+    ignore_sigint()
+    pool = FramePool.attach(pool_name)
+    stats = PipelineStats.attach(stats_name)
+    recorder = FrameRecorder(
+        path,
+        FRAME_SIZE,
+        dict(
+            width=W,
+            height=H,
+            pixel_format=PIXEL_FORMAT,
+            pixel_order=PIXEL_ORDER,
+            byte_order=BYTE_ORDER,
+        ),
+    )
 
+    try:
+        while not stop.is_set():
+            try:
+                slot = sub.get(timeout=0.5)
+            except Empty:
+                continue
 
-def main():
-    raw_queue = Queue(maxsize=32)
-    frame_queue = Queue(maxsize=16)
-    stop = Event()
+            try:
+                t0 = time.perf_counter()
+                meta = pool.meta[slot]
+                recorder.write(
+                    pool.frame(slot),
+                    int(meta["seq"]),
+                    float(meta["t_arrival"]),
+                    int(meta["flags"]),
+                    int(meta["length"]),
+                )
+                sub.release(slot)
+
+                stats.add("recorder_frames")
+                stats.add("recorder_bytes", FRAME_SIZE)
+                stats.add("recorder_write_seconds", time.perf_counter() - t0)
+            except Exception:
+                stats.add("recorder_errors")
+    finally:
+        recorder.close()
+        print(f"Recorded {recorder.frames} frames to '{path}.frames'")
+        sub.close()
+        pool.close()
+        stats.close()
+
+
+class FramePipeline:
+    """
+    Reader thread and marker detector process filling a shared FramePool.
+
+    Every detected frame's slot index arrives on frame_queue; whoever consumes
+    it releases the slot once done with the pixels.
+
+    Args:
+        source: SOURCE kind passed to make_source()
+        report_stats: Print and export the stats periodically
+        device: Board selector for the usb source
+        stats_name: Existing PipelineStats block to count into, reported by
+            its owner, instead of a new one
+    """
+
+    def __init__(
+        self, source=SOURCE, report_stats=True, device=DEVICE, stats_name=None
+    ):
+        self.source = source
+        self.report_stats = report_stats
+        self.device = device
+        self.stats_name = stats_name
+        self.ring = self.pool = self.stats = None
+        self.threads = []
+        self.detector_proc = None
+
+    def start(self):
+        src = make_source(self.source, self.device)
+        self.ring = ByteRing.create(RING_SIZE, RING_MIRROR)
+        self.pool = FramePool.create(FRAME_SLOTS, FRAME_SIZE)
+        if self.stats_name is not None:
+            self.stats = PipelineStats.attach(self.stats_name)
+        else:
+            self.stats = PipelineStats.create()
+        self.frame_queue = Queue(maxsize=FRAME_SLOTS)
+        self.stop = Event()
+
+        self.detector_proc = Process(
+            target=marker_detector_process,
+            args=(
+                self.ring.name,
+                self.pool.name,
+                self.stats.name,
+                self.frame_queue,
+                self.stop,
+            ),
+        )
+        self.detector_proc.start()
+
+        # Start the reader thread, the ring has a single producer, and the
+        # gauge sampler
+        self.threads = [
+            threading.Thread(
+                target=source_reader,
+                args=(src, self.ring, self.stats, self.stop),
+                daemon=True,
+            ),
+            threading.Thread(
+                target=stats_reporter,
+                args=(
+                    self.stats,
+                    self.ring,
+                    self.pool,
+                    self.frame_queue,
+                    self.stop,
+                    self.report_stats,
+                ),
+                daemon=True,
+            ),
+        ]
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def close(self):
+        """Stop every stage and free the shared buffers"""
+        if self.ring is None:
+            return
+        self.stop.set()
+        for thread in self.threads:
+            thread.join(timeout=1)
+
+        # A detector blocked on a full queue needs room to see the stop flag
+        try:
+            while True:
+                self.frame_queue.get_nowait()
+        except Empty:
+            pass
 
-    # Start processes
-    detector_proc = Process(
-        target=marker_detector_process, args=(raw_queue, frame_queue, stop)
+        self.detector_proc.join(timeout=2)
+        if self.detector_proc.is_alive():
+            self.detector_proc.terminate()
+
+        skipped = int(self.stats.snapshot()["reader_frames_skipped"])
+        if skipped:
+            print(f"Raw ring full: {skipped} whole frames skipped")
+        chunks, nbytes = self.ring.dropped()
+        if chunks:
+            print(
+                f"Raw ring overflow: {chunks} chunks ({nbytes / 1024 / 1024:.1f} MB) dropped"
+            )
+        self.ring.close()
+        self.pool.close()
+        self.stats.close()
+        self.ring = None
+
+
+def main(
+    source=SOURCE,
+    headless=HEADLESS,
+    record=RECORD,
+    serve=SERVE,
+    chain=PROCESS_CHAIN,
+    device=DEVICE,
+    label=None,
+    stats_name=None,
+):
+    """
+    Run the pipeline and its consumers until the display closes or Ctrl+C.
+
+    device, label and stats_name let several boards run side by side, see
+    multi_camera: label names the window and the recording, and a stats
+    block passed in is reported by its owner instead of here.
+    """
+    pipeline = FramePipeline(
+        source, report_stats=stats_name is None, device=device, stats_name=stats_name
+    ).start()
+    title = f"OV5640 {label}" if label else "OV5640"
+    record_path = f"{RECORD_PATH}_{label}" if label else RECORD_PATH
+    pool, stats, stop = pipeline.pool, pipeline.stats, pipeline.stop
+    process = bool(chain) and not headless
+
+    # Every consumer subscribes to the detector output with its own policy
+    subscribers = []
+    if process:
+        # The display follows the processing stage's in-order output instead
+        subscribers.append(("processor", POLICY_ALL, PROCESS_QUEUE))
+    elif not headless:
+        subscribers.append(("display", DISPLAY_POLICY, 1))
+    if record or (headless and not serve):
+        subscribers.append(("recorder", RECORD_POLICY, SUBSCRIBER_QUEUE))
+    if serve:
+        subscribers.append(("server", SERVER_POLICY, 1))
+    bus = FrameBus(pool, subscribers)
+    distributor = threading.Thread(
+        target=bus.run, args=(pipeline.frame_queue, stop, stats), daemon=True
     )
-    detector_proc.start()
-
-    display_proc = Process(target=display_process, args=(frame_queue, stop))
-    display_proc.start()
-
-    # Start USB reader threads
-    threads = []
-    for i in range(NUM_READERS):
-        t = threading.Thread(target=usb_reader, args=(raw_queue, stop, i), daemon=True)
-        t.start()
-        threads.append(t)
+    distributor.start()
+
+    stage = None
+    if process:
+        from frame_processing import ProcessingStage
+
+        stage = ProcessingStage(pool, stats, chain, [("display", DISPLAY_POLICY, 1)])
+        stage.start(bus.subscription("processor"), stop)
+
+    consumers = []
+    if process:
+        consumers.append(
+            Process(
+                target=display_process,
+                args=(
+                    stage.results.name,
+                    stats.name,
+                    stage.subscription("display"),
+                    stop,
+                    True,
+                    title,
+                ),
+            )
+        )
+    elif not headless:
+        consumers.append(
+            Process(
+                target=display_process,
+                args=(
+                    pool.name,
+                    stats.name,
+                    bus.subscription("display"),
+                    stop,
+                    False,
+                    title,
+                ),
+            )
+        )
+    if record or (headless and not serve):
+        consumers.append(
+            Process(
+                target=recorder_process,
+                args=(
+                    pool.name,
+                    stats.name,
+                    bus.subscription("recorder"),
+                    stop,
+                    record_path,
+                ),
+            )
+        )
+    if serve:
+        from frame_server import server_process
+
+        consumers.append(
+            Process(
+                target=server_process,
+                args=(pool.name, stats.name, bus.subscription("server"), stop),
+            )
+        )
+    for proc in consumers:
+        proc.start()
 
     try:
-        display_proc.join()
+        # Closing the display ends the session, otherwise run until Ctrl+C
+        consumers[0].join()
     except KeyboardInterrupt:
         pass
     finally:
         stop.set()
-
-        for t in threads:
-            t.join(timeout=1)
-
-        detector_proc.join(timeout=2)
-        display_proc.join(timeout=2)
-
-        if detector_proc.is_alive():
-            detector_proc.terminate()
-        if display_proc.is_alive():
-            display_proc.terminate()
+        for proc in consumers:
+            proc.join(timeout=2)
+            if proc.is_alive():
+                proc.terminate()
+        distributor.join(timeout=1)
+        if stage is not None:
+            stage.close()
+        print("Frame fan-out:")
+        print(bus.summary())
+        pipeline.close()
+        bus.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,86 @@
+"""
+Frame geometry and pixel format of the FPGA stream, derived from the OV5640
+register configuration the FPGA loads (ov5640_cfg.v) rather than hard-coded.
+"""
+
+import os
+import sys
+
+OV5640_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "OV5640")
+OV5640_CFG_PATH = os.path.join(OV5640_DIR, "ov5640_cfg.v")
+
+sys.path.insert(0, OV5640_DIR)
+from ov5640_calculator import OV5640Calculator  # noqa: E402
+
+
+class StreamFormat:
+    """
+    What one frame on the wire looks like.
+
+    Args:
+        width, height: Output resolution in pixels
+        pixel_format: "RGB565", "YUV422", "RAW8" or "Y8"
+        bytes_per_pixel: Bytes per pixel on the wire
+        component_order: YUV422 byte order or Bayer pattern, None otherwise
+        fps: Nominal sensor frame rate, None if unknown
+    """
+
+    def __init__(
+        self,
+        width,
+        height,
+        pixel_format="RGB565",
+        bytes_per_pixel=2,
+        component_order=None,
+        fps=None,
+    ):
+        self.width = width
+        self.height = height
+        self.pixel_format = pixel_format
+        self.bytes_per_pixel = bytes_per_pixel
+        self.component_order = component_order
+        self.fps = fps
+
+    @property
+    def frame_size(self):
+        """Pixel bytes per frame, marker excluded"""
+        return self.width * self.height * self.bytes_per_pixel
+
+    def __repr__(self):
+        order = f" {self.component_order}" if self.component_order else ""
+        return f"StreamFormat({self.width}x{self.height} {self.pixel_format}{order})"
+
+
+# Used when the sensor configuration cannot be read
+DEFAULT_FORMAT = StreamFormat(640, 480, "RGB565", 2, fps=51.45)
+
+
+def load_stream_format(path=OV5640_CFG_PATH):
+    """Read the stream format from an OV5640 register configuration file"""
+    calculator = OV5640Calculator()
+    if not os.path.exists(path):
+        print(f"Warning: '{path}' not found, assuming {DEFAULT_FORMAT}")
+        return DEFAULT_FORMAT
+    with open(path, "r", encoding="utf-8") as f:
+        registers = calculator.extract_registers_from_verilog(f.read(), verbose=False)
+
+    resolution = calculator.calculate_resolution_and_binning(registers)
+    output = calculator.calculate_output_format(registers)
+    clocks = calculator.calculate_pll_clocks(registers)
+    timing = calculator.calculate_frame_timing(registers, clocks["pixel_clk_mhz"])
+
+    width, height = resolution["output_width"], resolution["output_height"]
+    if width == 0 or height == 0 or output["pixel_format"].startswith("UNKNOWN"):
+        print(
+            f"Warning: no usable output format in '{path}', assuming {DEFAULT_FORMAT}"
+        )
+        return DEFAULT_FORMAT
+
+    return StreamFormat(
+        width,
+        height,
+        output["pixel_format"],
+        output["bytes_per_pixel"],
+        output["component_order"],
+        timing["frame_rate_fps"] or None,
+    )
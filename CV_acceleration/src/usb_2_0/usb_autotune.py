@@ -0,0 +1,256 @@
+"""
+Calibration of the USB transfer ring: sweeps transfer size, transfers in
+flight and timeout, measures sustained MB/s, reader CPU usage and the rate of
+torn frames for each, and saves the best setting as a profile that
+smooth_stream loads at startup.
+
+Against the board:
+    python CV_acceleration/src/usb_2_0/usb_autotune.py [--device serial=...]
+Against a dump replayed through a model of the link, without a board:
+    python CV_acceleration/src/usb_2_0/usb_autotune.py --simulate DUMP
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+
+from frame_source import MARKER_BYTES, SimulatedUsbSource, UsbTransferRing
+from marker_scanner import MarkerScanner, MARKER_MIN_SIZE
+from stream_format import load_stream_format
+from usb_devices import PID, VID
+
+EP_IN = 0x81
+TRANSFER_SIZES = (64 * 1024, 256 * 1024, 1024 * 1024, 4 * 1024 * 1024)
+DEPTHS = (2, 4, 8, 16, 32)
+TIMEOUTS_MS = (50, 250, 1000)
+TRIAL_SECONDS = 3.0
+WARMUP_SECONDS = 0.5  # Read but not measured, lets the ring reach steady state
+MAX_LOSS_RATE = 0.001  # Torn frames per frame a setting may show to qualify
+RATE_MARGIN = 0.02  # Settings this close to the best MB/s are ranked by CPU
+PROFILE_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "usb_profile.json"
+)
+# --simulate results, kept apart so they never replace a real profile
+SIMULATED_PROFILE_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "usb_profile.simulated.json"
+)
+
+
+def load_usb_profile(path=PROFILE_PATH):
+    """
+    The saved profile as a dict, None if there is none, it was measured
+    on another host, since the best values depend on its USB controller,
+    or on a simulated link.
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            profile = json.load(f)
+        settings = (
+            profile["transfer_size"],
+            profile["num_transfers"],
+            profile["timeout_ms"],
+        )
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Warning: ignoring USB profile '{path}': {e}")
+        return None
+    if profile.get("host") != platform.node():
+        print(
+            f"Warning: USB profile '{path}' was measured on {profile.get('host')}, "
+            "ignoring it; run usb_autotune.py on this host"
+        )
+        return None
+    if profile.get("source") != "usb":
+        print(
+            f"Warning: USB profile '{path}' was measured on a {profile.get('source')} "
+            "link, ignoring it; run usb_autotune.py against the board"
+        )
+        return None
+    if not all(isinstance(v, int) and v > 0 for v in settings):
+        print(f"Warning: ignoring USB profile '{path}': invalid settings")
+        return None
+    return profile
+
+
+def torn_by_loss(lost_ranges, start, frame_bytes):
+    """Frames touched by the [begin, end) stream ranges lost after start"""
+    torn, last = 0, -1
+    for begin, end in lost_ranges:
+        if end <= start:
+            continue
+        first = max(begin, start) // frame_bytes
+        torn += (end - 1) // frame_bytes - first + (first != last)
+        last = (end - 1) // frame_bytes
+    return torn
+
+
+def trial(source, frame_bytes, seconds=TRIAL_SECONDS):
+    """
+    Stream from source for seconds and measure it.
+
+    A SimulatedUsbSource reports the bytes its link dropped, which count
+    as torn frames. Markers would also flag the seam where the dump loops
+    and any frame already torn in the dump.
+
+    Returns a dict with mb_s, cpu (fraction of one core spent by the reader),
+    frames, torn frames, loss_rate, timeouts and errors; None if the source
+    could not be opened.
+    """
+    if not source.open():
+        return None
+    scanner = MarkerScanner(
+        MARKER_MIN_SIZE, max_chunk=getattr(source, "transfer_size", 1 << 20)
+    )
+    try:
+        t_end = time.perf_counter() + WARMUP_SECONDS
+        while time.perf_counter() < t_end:
+            source.read()
+
+        nbytes = timeouts = errors = 0
+        ends = []
+        produced = getattr(source, "produced", 0)
+        t0, c0 = time.perf_counter(), time.process_time()
+        t_end = t0 + seconds
+        while time.perf_counter() < t_end:
+            try:
+                data = source.read()
+            except EOFError:
+                break
+            except Exception:
+                errors += 1
+                continue
+            if data is None:
+                timeouts += 1
+                continue
+            nbytes += len(data)
+            ends.extend(scanner.feed(data).tolist())
+        dt = time.perf_counter() - t0
+        cpu = (time.process_time() - c0) / dt
+    finally:
+        source.close()
+
+    if hasattr(source, "lost_ranges"):
+        frames = (source.produced - produced) // frame_bytes
+        torn = min(frames, torn_by_loss(source.lost_ranges, produced, frame_bytes))
+    else:
+        # Any frame not exactly one frame apart from the previous marker was torn
+        lengths = np.diff(np.asarray(ends, dtype=np.int64))
+        frames = int(lengths.size)
+        torn = int(np.count_nonzero(lengths != frame_bytes))
+    return {
+        "mb_s": nbytes / dt / 1024 / 1024,
+        "cpu": cpu,
+        "frames": frames,
+        "torn": torn,
+        "loss_rate": torn / frames if frames else 1.0,
+        "timeouts": timeouts,
+        "errors": errors,
+    }
+
+
+def pick_best(results):
+    """
+    The lowest-CPU setting among those within RATE_MARGIN of the best MB/s
+    with no more than MAX_LOSS_RATE torn frames; the lowest loss if none qualify.
+    """
+    ok = [r for r in results if r["loss_rate"] <= MAX_LOSS_RATE and r["frames"]]
+    if not ok:
+        return min(results, key=lambda r: (r["loss_rate"], -r["mb_s"]))
+    best_rate = max(r["mb_s"] for r in ok)
+    fast = [r for r in ok if r["mb_s"] >= best_rate * (1 - RATE_MARGIN)]
+    return min(fast, key=lambda r: r["cpu"])
+
+
+def sweep(make_source, frame_bytes, sizes, depths, timeouts, seconds):
+    results = []
+    print(
+        f"{'transfer':>9} {'depth':>5} {'timeout':>7} {'MB/s':>7} {'cpu':>5} "
+        f"{'frames':>6} {'torn':>5} {'t/o':>5}"
+    )
+    for size, depth, timeout_ms in itertools.product(sizes, depths, timeouts):
+        r = trial(make_source(size, depth, timeout_ms), frame_bytes, seconds)
+        if r is None:
+            raise SystemExit("Source unavailable, nothing to calibrate")
+        r.update(transfer_size=size, num_transfers=depth, timeout_ms=timeout_ms)
+        results.append(r)
+        print(
+            f"{size // 1024:>7}KB {depth:>5} {timeout_ms:>5}ms {r['mb_s']:7.2f} "
+            f"{r['cpu'] * 100:4.0f}% {r['frames']:>6} {r['torn']:>5} {r['timeouts']:>5}",
+            flush=True,
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--device", help="Board selector, see usb_devices")
+    parser.add_argument("--simulate", metavar="DUMP", help="Sweep a simulated link")
+    parser.add_argument("--seconds", type=float, default=TRIAL_SECONDS)
+    parser.add_argument(
+        "--profile", help=f"Output file, by default {PROFILE_PATH} for the board"
+    )
+    parser.add_argument(
+        "--quick", action="store_true", help="Fewer settings, for a first look"
+    )
+    args = parser.parse_args()
+    if args.profile is None:
+        args.profile = SIMULATED_PROFILE_PATH if args.simulate else PROFILE_PATH
+
+    fmt = load_stream_format()
+    frame_bytes = fmt.frame_size + MARKER_BYTES
+    if args.simulate:
+        rate = (fmt.fps or 30.0) * frame_bytes
+
+        def make_source(size, depth, timeout_ms):
+            return SimulatedUsbSource(args.simulate, size, depth, timeout_ms, rate)
+
+    else:
+
+        def make_source(size, depth, timeout_ms):
+            return UsbTransferRing(
+                VID, PID, EP_IN, size, depth, timeout_ms, args.device
+            )
+
+    sizes, depths, timeouts = TRANSFER_SIZES, DEPTHS, TIMEOUTS_MS
+    if args.quick:
+        sizes, depths, timeouts = sizes[::2], depths[::2], timeouts[-1:]
+    print(f"Calibrating {'simulated link' if args.simulate else 'USB'} for {fmt}")
+    results = sweep(make_source, frame_bytes, sizes, depths, timeouts, args.seconds)
+
+    best = pick_best(results)
+    profile = {
+        "transfer_size": best["transfer_size"],
+        "num_transfers": best["num_transfers"],
+        "timeout_ms": best["timeout_ms"],
+        "mb_s": best["mb_s"],
+        "cpu": best["cpu"],
+        "loss_rate": best["loss_rate"],
+        "source": "simulated" if args.simulate else "usb",
+        "device": args.device,
+        "host": platform.node(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "trials": results,
+    }
+    with open(args.profile, "w", encoding="utf-8") as f:
+        json.dump(profile, f, indent=2)
+    print(
+        f"Best: {best['transfer_size'] // 1024} KB x {best['num_transfers']} "
+        f"transfers, {best['timeout_ms']} ms timeout: {best['mb_s']:.2f} MB/s, "
+        f"{best['cpu'] * 100:.0f}% CPU, {best['loss_rate'] * 100:.2f}% torn frames"
+    )
+    print(f"Saved profile to '{args.profile}'")
+    if best["loss_rate"] > MAX_LOSS_RATE:
+        print("Warning: no setting streamed without torn frames")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
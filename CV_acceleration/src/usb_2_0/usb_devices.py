@@ -0,0 +1,177 @@
+"""
+Enumeration and selection of FPGA boards on the USB bus, so several boards can
+stream from one host.
+
+A selector picks one board:
+    serial=ABC123   iSerialNumber string
+    port=1-2.3      Bus and port path, as named in /sys/bus/usb/devices
+    bus=1           The only board on bus 1
+A bare "1-2.3" is read as a port path and a bare number as a bus.
+"""
+
+import sys
+
+import usb1
+
+VID, PID = 0x33AA, 0x0000
+
+
+def port_path(bus, ports):
+    """sysfs style name of a device position, e.g. 1-2.3"""
+    if not ports:
+        return str(bus)
+    return f"{bus}-" + ".".join(str(p) for p in ports)
+
+
+class DeviceSelector:
+    """
+    Criteria a board must meet, None matches anything.
+
+    Args:
+        bus: USB bus number
+        port: Port path as returned by port_path()
+        serial: Serial number string
+    """
+
+    def __init__(self, bus=None, port=None, serial=None):
+        self.bus = bus
+        self.port = port
+        self.serial = serial
+
+    @classmethod
+    def parse(cls, text):
+        key, sep, value = text.strip().partition("=")
+        if not sep:
+            key, value = ("port" if "-" in key else "bus"), key
+        if key == "bus":
+            return cls(bus=int(value))
+        if key == "port":
+            return cls(port=value)
+        if key == "serial":
+            return cls(serial=value)
+        raise ValueError(f"Unknown device selector '{text}'")
+
+    @property
+    def label(self):
+        """Short name for the selected board, for file names and windows"""
+        if self.serial is not None:
+            return self.serial
+        if self.port is not None:
+            return self.port
+        return f"bus{self.bus}"
+
+    def matches(self, bus, ports, serial):
+        """
+        Args:
+            bus, ports: Position of the device
+            serial: Serial number, or a callable returning it; only called
+                when needed, as reading it means opening the device
+        """
+        if self.bus is not None and bus != self.bus:
+            return False
+        if self.port is not None and port_path(bus, ports) != self.port:
+            return False
+        if self.serial is not None:
+            return (serial() if callable(serial) else serial) == self.serial
+        return True
+
+    def __str__(self):
+        fields = [f"{k}={v}" for k, v in vars(self).items() if v is not None]
+        return ",".join(fields) or "any"
+
+
+class DeviceInfo:
+    """One board found on the bus"""
+
+    def __init__(self, bus, address, ports, serial, speed):
+        self.bus = bus
+        self.address = address
+        self.ports = tuple(ports)
+        self.serial = serial
+        self.speed = speed
+
+    @property
+    def port(self):
+        return port_path(self.bus, self.ports)
+
+    def __repr__(self):
+        return (
+            f"DeviceInfo(port={self.port}, address={self.address}, "
+            f"serial={self.serial!r}, speed={self.speed})"
+        )
+
+
+_SPEEDS = {
+    usb1.SPEED_LOW: "low",
+    usb1.SPEED_FULL: "full",
+    usb1.SPEED_HIGH: "high",
+    usb1.SPEED_SUPER: "super",
+}
+
+
+def _serial(device):
+    """Serial number of a usb1 device, None if it has none or cannot be opened"""
+    try:
+        return device.getSerialNumber()
+    except usb1.USBError:
+        return None
+
+
+def _matching(context, vid, pid):
+    for device in context.getDeviceIterator(skip_on_error=True):
+        if device.getVendorID() == vid and device.getProductID() == pid:
+            yield device
+
+
+def list_devices(vid=VID, pid=PID):
+    """Every board with the given IDs, ordered by position"""
+    with usb1.USBContext() as context:
+        boards = [
+            DeviceInfo(
+                d.getBusNumber(),
+                d.getDeviceAddress(),
+                d.getPortNumberList(),
+                _serial(d),
+                _SPEEDS.get(d.getDeviceSpeed(), "unknown"),
+            )
+            for d in _matching(context, vid, pid)
+        ]
+    return sorted(boards, key=lambda b: (b.bus, b.ports))
+
+
+def find_device(context, selector, vid=VID, pid=PID):
+    """
+    The usb1 device picked by selector, None if no board matches.
+    Raises ValueError if the selector matches more than one board.
+    """
+    found = [
+        d
+        for d in _matching(context, vid, pid)
+        if selector.matches(
+            d.getBusNumber(), d.getPortNumberList(), lambda d=d: _serial(d)
+        )
+    ]
+    if len(found) > 1:
+        ports = ", ".join(
+            port_path(d.getBusNumber(), d.getPortNumberList()) for d in found
+        )
+        raise ValueError(f"Selector '{selector}' matches several boards: {ports}")
+    return found[0] if found else None
+
+
+def main():
+    boards = list_devices()
+    if not boards:
+        print(f"No boards with VID=0x{VID:04X} PID=0x{PID:04X} found")
+        return 1
+    print(f"{'port':<12} {'address':>7}  {'speed':<7} serial")
+    for board in boards:
+        print(
+            f"{board.port:<12} {board.address:>7}  {board.speed:<7} "
+            f"{board.serial or '-'}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())